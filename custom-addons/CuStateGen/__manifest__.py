@@ -46,15 +46,18 @@
     'data': [
         'security/ir.model.access.csv',
         'data/default_templates.xml',
+        'data/cron_jobs.xml',
         'views/customer_account_views.xml',
         'views/customer_statement_views.xml',
         'views/material_analysis_views.xml',
         'views/supplier_analytics_views.xml',
         'views/dashboard_views.xml',
+        'views/statement_run_views.xml',
         'wizards/statement_generator_wizard_views.xml',
         'wizards/bulk_sync_wizard_views.xml',
         'reports/statement_report.xml',
         'reports/material_report.xml',
+        'data/mail_templates.xml',
     ],
     'installable': True,
     'application': True,
@@ -3,4 +3,6 @@ from . import customer_statement
 from . import statement_line
 from . import material_analysis
 from . import supplier_analytics
-from . import statement_template
\ No newline at end of file
+from . import statement_template
+from . import erpnext_config
+from . import statement_run
\ No newline at end of file
@@ -1,9 +1,13 @@
 from odoo import models, fields, api
 from odoo.exceptions import UserError
+from collections import defaultdict
 import logging
 
 _logger = logging.getLogger(__name__)
 
+# Account fields kept in line with the ERPNext customer by the sync
+SYNCED_CUSTOMER_FIELDS = ('name', 'customer_name', 'email', 'customer_group', 'territory')
+
 class CustomerAccount(models.Model):
     _name = 'customer.account'
     _description = 'Customer Account Synced from ERPNext'
@@ -141,14 +145,10 @@ class CustomerAccount(models.Model):
         if not config:
             raise UserError('No active ERPNext configuration found.')
         
-        import requests
-        
-        url = f"{config.base_url}/api/resource/Customer/{self.erpnext_customer_id}"
+        path = f"/api/resource/Customer/{self.erpnext_customer_id}"
         
         try:
-            response = requests.get(url, headers=config._get_headers())
-            response.raise_for_status()
-            data = response.json().get('data', {})
+            data = config._get_client().get(path).get('data', {})
             
             self.write({
                 'customer_name': data.get('customer_name', self.customer_name),
@@ -185,39 +185,8 @@ class CustomerAccount(models.Model):
         if not config:
             raise UserError('No active ERPNext configuration found.')
         
-        import requests
-        
-        url = f"{config.base_url}/api/resource/Customer"
-        params = {'fields': '["name", "customer_name", "email_id", "customer_group"]'}
-        
         try:
-            response = requests.get(url, headers=config._get_headers(), params=params)
-            response.raise_for_status()
-            customers = response.json().get('data', [])
-            
-            created_count = 0
-            updated_count = 0
-            
-            for customer_data in customers:
-                existing = self.search([
-                    ('erpnext_customer_id', '=', customer_data['name'])
-                ])
-                
-                vals = {
-                    'name': customer_data['name'],
-                    'customer_name': customer_data.get('customer_name', customer_data['name']),
-                    'erpnext_customer_id': customer_data['name'],
-                    'email': customer_data.get('email_id'),
-                    'customer_group': customer_data.get('customer_group'),
-                    'last_sync_date': fields.Datetime.now(),
-                }
-                
-                if existing:
-                    existing.write(vals)
-                    updated_count += 1
-                else:
-                    self.create(vals)
-                    created_count += 1
+            created_count, updated_count, _error_count = self._sync_customers_from_erpnext(config)
             
             return {
                 'type': 'ir.actions.client',
@@ -233,6 +202,95 @@ class CustomerAccount(models.Model):
             _logger.error(f"Bulk sync failed: {str(e)}")
             raise UserError(f'Bulk sync failed: {str(e)}')
 
+    @api.model
+    def _sync_customers_from_erpnext(self, config, customer_group=None, full=False):
+        """Apply the ERPNext customers changed since the config's high-water mark.
+
+        Customers are fetched page by page, oldest change first, and matched
+        to existing accounts through an erpnext_customer_id map of their
+        synced values loaded in one query. Per page, new customers are
+        created in one call; existing ones are only written when a value
+        changed, with one write per identical set of changes. The mark only moves
+        on unfiltered syncs, so a group-filtered run cannot hide other
+        groups' changes. full ignores the mark.
+        Returns (created count, changed count, error count).
+        """
+        since = not full and config.customer_sync_modified
+        filters = [['customer_group', '=', customer_group]] if customer_group else []
+        fields_list = ['name', 'customer_name', 'email_id', 'customer_group', 'territory']
+        
+        self.flush_model(['erpnext_customer_id', *SYNCED_CUSTOMER_FIELDS])
+        self.env.cr.execute(f"SELECT erpnext_customer_id, id, {', '.join(SYNCED_CUSTOMER_FIELDS)} FROM {self._table}")
+        accounts = {row[0]: (row[1], dict(zip(SYNCED_CUSTOMER_FIELDS, row[2:]))) for row in self.env.cr.fetchall()}
+        
+        created = 0
+        updated = 0
+        errors = 0
+        high_water = since or None
+        now = fields.Datetime.now()
+        for page in config._get_client().iter_changed('Customer', fields_list, since or None, filters):
+            create_vals = {}
+            changes = defaultdict(list)
+            synced_ids = []
+            for customer_data in page:
+                vals = {
+                    'name': customer_data['name'],
+                    'customer_name': customer_data.get('customer_name') or customer_data['name'],
+                    'email': customer_data.get('email_id'),
+                    'customer_group': customer_data.get('customer_group'),
+                    'territory': customer_data.get('territory'),
+                }
+                account = accounts.get(customer_data['name'])
+                if account:
+                    account_id, current = account
+                    changed = {
+                        field_name: value for field_name, value in vals.items()
+                        if (value or False) != (current[field_name] or False)
+                    }
+                    if changed:
+                        changes[tuple(sorted(changed.items()))].append(account_id)
+                        current.update(changed)
+                    synced_ids.append(account_id)
+                else:
+                    create_vals[customer_data['name']] = dict(
+                        vals, erpnext_customer_id=customer_data['name'], last_sync_date=now
+                    )
+            
+            for changed, changed_ids in changes.items():
+                self.browse(changed_ids).write(dict(changed))
+                updated += len(changed_ids)
+            if synced_ids:
+                self.browse(synced_ids).write({'last_sync_date': now})
+            
+            if create_vals:
+                try:
+                    with self.env.cr.savepoint():
+                        created_accounts = self.create(list(create_vals.values()))
+                    for customer_id, account in zip(create_vals, created_accounts):
+                        accounts[customer_id] = (account.id, create_vals[customer_id])
+                    created += len(created_accounts)
+                except Exception as e:
+                    # Find the offending rows one by one
+                    _logger.warning(f"Batch customer create failed, retrying one by one: {str(e)}")
+                    for customer_id, vals in create_vals.items():
+                        try:
+                            with self.env.cr.savepoint():
+                                account = self.create(vals)
+                            accounts[customer_id] = (account.id, vals)
+                            created += 1
+                        except Exception as e:
+                            _logger.error(f"Failed to sync customer {customer_id}: {str(e)}")
+                            errors += 1
+            
+            if not errors:
+                # Failed customers stay after the mark and are fetched again next time
+                high_water = page[-1]['modified']
+        
+        if not customer_group and high_water != config.customer_sync_modified:
+            config.customer_sync_modified = high_water
+        _logger.info(f"Customer sync: {created} created, {updated} updated, {errors} errors (since {since or 'the beginning'})")
+        return created, updated, errors
+
     def action_generate_statement(self):
         """Open wizard to generate statement"""
         self.ensure_one()
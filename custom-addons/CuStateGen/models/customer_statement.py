@@ -1,10 +1,40 @@
 from odoo import models, fields, api
 from odoo.exceptions import UserError
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from urllib.parse import quote_plus
+import hashlib
+import json
 import logging
+import os
+import shutil
+import tempfile
+import zipfile
 
 _logger = logging.getLogger(__name__)
 
+# ERPNext lists fetched for each statement, in line order
+STATEMENT_LINE_TYPES = ('invoice', 'payment', 'credit')
+# From this many statements on, each list is fetched once for all customers
+BULK_FETCH_MIN_STATEMENTS = 20
+# Up to this many customers a bulk fetch filters on them; beyond, it takes the whole period
+BULK_FILTER_MAX_CUSTOMERS = 200
+# URL-encoded size of one customer filter; longer lists are split, since the
+# filter is repeated in the query string of every page (proxies cap it at ~8 KB)
+BULK_FILTER_MAX_BYTES = 4096
+STATEMENT_REPORT = 'CuStateGen.action_report_customer_statement'
+# Statements rendered per wkhtmltopdf call, and calls running at once
+RENDER_CHUNK_SIZE = 25
+RENDER_WORKERS = 4
+# Bytes copied at a time when streaming the PDF bundle into the filestore
+BUNDLE_COPY_BLOCK = 1024 * 1024
+# Fields that do not show on the PDF: writing them keeps the cached PDF
+PDF_CACHE_NEUTRAL_FIELDS = {'state', 'internal_notes', 'pdf_attachment_id'}
+# Name prefix of the cached PDF attachments; only attachments carrying it are ever invalidated
+PDF_CACHE_PREFIX = 'statement-pdf-cache-'
+STATEMENT_MAIL_TEMPLATE = 'CuStateGen.mail_template_customer_statement'
+
 class CustomerStatement(models.Model):
     _name = 'customer.statement'
     _description = 'Customer Account Statement'
@@ -86,6 +116,13 @@ class CustomerStatement(models.Model):
     )
     notes = fields.Text(string='Notes')
     internal_notes = fields.Text(string='Internal Notes')
+    pdf_attachment_id = fields.Many2one(
+        'ir.attachment',
+        string='Statement PDF',
+        readonly=True,
+        copy=False,
+        help='Cached PDF, reused as long as the statement content is unchanged'
+    )
     
     # Status
     state = fields.Selection([
@@ -108,13 +145,20 @@ class CustomerStatement(models.Model):
         help='Confidence score from payment prediction'
     )
 
-    @api.model
-    def create(self, vals):
-        if vals.get('statement_number', 'New') == 'New':
-            vals['statement_number'] = self.env['ir.sequence'].next_by_code(
-                'customer.statement'
-            ) or 'New'
-        return super().create(vals)
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            if vals.get('statement_number', 'New') == 'New':
+                vals['statement_number'] = self.env['ir.sequence'].next_by_code(
+                    'customer.statement'
+                ) or 'New'
+        return super().create(vals_list)
+
+    def write(self, vals):
+        res = super().write(vals)
+        if set(vals) - PDF_CACHE_NEUTRAL_FIELDS:
+            self._invalidate_pdf_cache()
+        return res
 
     @api.depends('line_ids')
     def _compute_line_count(self):
@@ -165,24 +209,10 @@ class CustomerStatement(models.Model):
         if not config:
             raise UserError('No active ERPNext configuration found.')
         
-        import requests
-        
-        # Fetch Sales Invoices
-        self._fetch_invoices(config)
-        
-        # Fetch Payment Entries
-        self._fetch_payments(config)
-        
-        # Fetch Credit Notes
-        self._fetch_credit_notes(config)
-        
-        # Calculate aging
-        self._calculate_aging()
-        
-        # Try to predict payment date
-        self._predict_payment()
-        
-        self.state = 'generated'
+        # Invoices, payments and credit notes are fetched concurrently
+        errors = self._fetch_lines_from_erpnext(config)
+        if errors:
+            raise UserError(errors[self.id])
         
         return {
             'type': 'ir.actions.client',
@@ -194,121 +224,292 @@ class CustomerStatement(models.Model):
             }
         }
 
-    def _fetch_invoices(self, config):
-        """Fetch sales invoices from ERPNext"""
-        import requests
+    @api.model
+    def _prepare_statements(self, customers, date_from, date_to, template=None):
+        """Return one statement per customer for the period, emptied for a refresh.
+
+        Existing statements are looked up in one search and their lines
+        removed in one unlink; missing ones are created in one call.
+        """
+        existing = {}
+        for statement in self.search([
+            ('customer_id', 'in', customers.ids),
+            ('date_from', '=', date_from),
+            ('date_to', '=', date_to)
+        ], order='id'):
+            existing.setdefault(statement.customer_id.id, statement)
         
-        url = f"{config.base_url}/api/resource/Sales Invoice"
-        filters = {
-            'customer': self.customer_id.erpnext_customer_id,
-            'posting_date': ['between', [
-                self.date_from.strftime('%Y-%m-%d'),
-                self.date_to.strftime('%Y-%m-%d')
-            ]],
-            'docstatus': 1  # Submitted only
-        }
-        params = {
-            'filters': str(filters),
-            'fields': '["name", "posting_date", "grand_total", "outstanding_amount", "due_date"]'
-        }
+        statements = self.browse([statement.id for statement in existing.values()])
+        # Refresh data; the cached PDFs are checked once the new lines are in
+        statements.line_ids.with_context(defer_statement_pdf_cache=True).unlink()
         
-        try:
-            response = requests.get(url, headers=config._get_headers(), params=params)
-            response.raise_for_status()
-            invoices = response.json().get('data', [])
-            
-            for inv in invoices:
-                self.env['customer.statement.line'].create({
-                    'statement_id': self.id,
-                    'date': inv['posting_date'],
-                    'line_type': 'invoice',
-                    'reference': inv['name'],
-                    'description': f"Invoice {inv['name']}",
-                    'amount': inv['grand_total'],
-                    'outstanding': inv.get('outstanding_amount', 0),
-                    'due_date': inv.get('due_date'),
-                })
-            
-            _logger.info(f"Fetched {len(invoices)} invoices for {self.customer_id.name}")
-            
-        except Exception as e:
-            _logger.error(f"Failed to fetch invoices: {str(e)}")
-            raise UserError(f'Failed to fetch invoices: {str(e)}')
+        vals_list = []
+        for customer in customers:
+            if customer.id not in existing:
+                vals = {
+                    'customer_id': customer.id,
+                    'date_from': date_from,
+                    'date_to': date_to,
+                }
+                if template:
+                    vals['template_id'] = template.id
+                vals_list.append(vals)
+        return statements | self.create(vals_list)
+
+    def _fetch_lines_from_erpnext(self, config):
+        """Fetch the ERPNext documents of these statements and fill them in.
 
-    def _fetch_payments(self, config):
-        """Fetch payment entries from ERPNext"""
-        import requests
+        Small runs fetch each statement's lists separately and concurrently;
+        from BULK_FETCH_MIN_STATEMENTS on, each list is fetched once for the
+        whole period and split per customer.
+        Returns {statement id: error} for the statements whose invoices could
+        not be fetched or whose lines could not be built; missing payments or
+        credit notes are only logged.
+        """
+        if len(self) >= BULK_FETCH_MIN_STATEMENTS:
+            return self._fetch_lines_in_bulk(config)
+        return self._fetch_lines_per_statement(config)
+
+    def _fetch_lines_per_statement(self, config):
+        """Fetch every statement's invoice, payment and credit note lists as separate jobs.
+
+        Jobs run on sync_concurrency threads through the shared client; a
+        statement's lines are created in one call as soon as its three lists
+        are in. Worker threads only get plain values.
+        """
+        client = config._get_client()
+        queries = {}
+        for statement in self:
+            statement_queries = self._erpnext_queries(
+                statement.date_from, statement.date_to, statement.customer_id.erpnext_customer_id
+            )
+            for line_type, (doctype, fields_list, filters, _partner_field) in statement_queries.items():
+                queries[(statement.id, line_type)] = (doctype, fields_list, filters)
         
-        url = f"{config.base_url}/api/resource/Payment Entry"
-        filters = {
-            'party': self.customer_id.erpnext_customer_id,
-            'posting_date': ['between', [
-                self.date_from.strftime('%Y-%m-%d'),
-                self.date_to.strftime('%Y-%m-%d')
-            ]],
-            'docstatus': 1
-        }
-        params = {
-            'filters': str(filters),
-            'fields': '["name", "posting_date", "paid_amount", "reference_no"]'
-        }
+        fetched = {statement.id: {} for statement in self}
+        errors = {}
+        with ThreadPoolExecutor(max_workers=max(config.sync_concurrency, 1)) as executor:
+            futures = {
+                executor.submit(self._fetch_documents, client, *query): key
+                for key, query in queries.items()
+            }
+            for future in as_completed(futures):
+                statement_id, line_type = futures[future]
+                try:
+                    documents = future.result()
+                except Exception as e:
+                    _logger.error(f"Failed to fetch {line_type} documents for statement {statement_id}: {str(e)}")
+                    documents = []
+                    if line_type == 'invoice':
+                        errors[statement_id] = f'Failed to fetch invoices: {str(e)}'
+                
+                documents_by_type = fetched[statement_id]
+                documents_by_type[line_type] = documents
+                if len(documents_by_type) == len(STATEMENT_LINE_TYPES):
+                    del fetched[statement_id]
+                    if statement_id not in errors:
+                        error = self.browse(statement_id)._apply_erpnext_documents_isolated(documents_by_type)
+                        if error:
+                            errors[statement_id] = error
         
-        try:
-            response = requests.get(url, headers=config._get_headers(), params=params)
-            response.raise_for_status()
-            payments = response.json().get('data', [])
-            
-            for pay in payments:
-                self.env['customer.statement.line'].create({
-                    'statement_id': self.id,
-                    'date': pay['posting_date'],
-                    'line_type': 'payment',
-                    'reference': pay['name'],
-                    'description': f"Payment {pay.get('reference_no', pay['name'])}",
-                    'amount': pay['paid_amount'],
-                })
+        return errors
+
+    def _fetch_lines_in_bulk(self, config):
+        """Fetch each list once per period for all the statements' customers.
+
+        The lists of a period are streamed concurrently, filtered on the
+        customers (split into filters short enough for a URL, or, for many
+        customers, only on the period) and partitioned per customer in
+        memory; 3 x N requests become a few paginated streams.
+        """
+        client = config._get_client()
+        periods = defaultdict(list)
+        for statement in self:
+            periods[(statement.date_from, statement.date_to)].append(statement.id)
+        
+        errors = {}
+        for (date_from, date_to), statement_ids in periods.items():
+            statements = self.browse(statement_ids)
+            customers = sorted(set(statements.mapped('customer_id.erpnext_customer_id')))
+            if len(customers) <= BULK_FILTER_MAX_CUSTOMERS:
+                customer_filters = self._customer_filter_chunks(customers)
+            else:
+                customer_filters = [None]
+            chunk_of = {
+                customer: index
+                for index, customer_filter in enumerate(customer_filters) if customer_filter
+                for customer in customer_filter[1]
+            }
+            queries = {
+                (line_type, index): query
+                for index, customer_filter in enumerate(customer_filters)
+                for line_type, query in self._erpnext_queries(date_from, date_to, customer_filter).items()
+            }
             
-            _logger.info(f"Fetched {len(payments)} payments")
+            partitions = {line_type: {} for line_type in STATEMENT_LINE_TYPES}
+            invoice_errors = {}
+            with ThreadPoolExecutor(max_workers=min(max(config.sync_concurrency, 1), len(queries))) as executor:
+                futures = {
+                    executor.submit(self._fetch_partitioned, client, *query): key
+                    for key, query in queries.items()
+                }
+                for future in as_completed(futures):
+                    line_type, index = futures[future]
+                    try:
+                        partitions[line_type].update(future.result())
+                    except Exception as e:
+                        _logger.error(f"Failed to fetch {line_type} documents for {date_from} - {date_to}: {str(e)}")
+                        if line_type == 'invoice':
+                            invoice_errors[index] = f'Failed to fetch invoices: {str(e)}'
             
-        except Exception as e:
-            _logger.error(f"Failed to fetch payments: {str(e)}")
+            for statement in statements:
+                customer = statement.customer_id.erpnext_customer_id
+                error = invoice_errors.get(chunk_of.get(customer, 0))
+                if not error:
+                    error = statement._apply_erpnext_documents_isolated({
+                        line_type: partitions[line_type].get(customer, [])
+                        for line_type in STATEMENT_LINE_TYPES
+                    })
+                if error:
+                    errors[statement.id] = error
+        
+        return errors
+
+    @staticmethod
+    def _customer_filter_chunks(customers):
+        """Split customers into ['in', names] filters of at most BULK_FILTER_MAX_BYTES once URL-encoded"""
+        separator = len(quote_plus(', '))
+        chunks = [[]]
+        size = 0
+        for customer in customers:
+            encoded = len(quote_plus(json.dumps(customer))) + separator
+            if chunks[-1] and size + encoded > BULK_FILTER_MAX_BYTES:
+                chunks.append([])
+                size = 0
+            chunks[-1].append(customer)
+            size += encoded
+        return [['in', chunk] for chunk in chunks]
 
-    def _fetch_credit_notes(self, config):
-        """Fetch credit notes from ERPNext"""
-        import requests
+    @api.model
+    def _erpnext_queries(self, date_from, date_to, customer_filter=None):
+        """Return {line type: (doctype, fields, filters, customer field)} of the ERPNext lists behind statements.
+
+        customer_filter is a customer name, an ['in', names] condition, or
+        None for every customer.
+        """
+        period = ['between', [
+            date_from.strftime('%Y-%m-%d'),
+            date_to.strftime('%Y-%m-%d')
+        ]]
+        invoice_filters = {'posting_date': period, 'docstatus': 1}  # Submitted only
+        payment_filters = {'party_type': 'Customer', 'posting_date': period, 'docstatus': 1}
+        credit_filters = {'is_return': 1, 'posting_date': period, 'docstatus': 1}
+        if customer_filter:
+            invoice_filters['customer'] = customer_filter
+            payment_filters['party'] = customer_filter
+            credit_filters['customer'] = customer_filter
         
-        url = f"{config.base_url}/api/resource/Sales Invoice"
-        filters = {
-            'customer': self.customer_id.erpnext_customer_id,
-            'is_return': 1,
-            'posting_date': ['between', [
-                self.date_from.strftime('%Y-%m-%d'),
-                self.date_to.strftime('%Y-%m-%d')
-            ]],
-            'docstatus': 1
-        }
-        params = {
-            'filters': str(filters),
-            'fields': '["name", "posting_date", "grand_total"]'
+        return {
+            'invoice': (
+                'Sales Invoice',
+                ['name', 'posting_date', 'grand_total', 'outstanding_amount', 'due_date'],
+                invoice_filters,
+                'customer',
+            ),
+            'payment': (
+                'Payment Entry',
+                ['name', 'posting_date', 'paid_amount', 'reference_no'],
+                payment_filters,
+                'party',
+            ),
+            'credit': (
+                'Sales Invoice',
+                ['name', 'posting_date', 'grand_total'],
+                credit_filters,
+                'customer',
+            ),
         }
-        
+
+    @staticmethod
+    def _fetch_documents(client, doctype, fields_list, filters):
+        """Fetch every page of a list (worker thread)"""
+        return [doc for page in client.iter_pages(doctype, fields_list, filters) for doc in page]
+
+    @staticmethod
+    def _fetch_partitioned(client, doctype, fields_list, filters, customer_field):
+        """Stream a list page by page into {customer: documents} (worker thread)"""
+        partitions = defaultdict(list)
+        for page in client.iter_pages(doctype, fields_list + [customer_field], filters):
+            for doc in page:
+                partitions[doc[customer_field]].append(doc)
+        return partitions
+
+    def _apply_erpnext_documents_isolated(self, documents_by_type):
+        """Apply the documents in a savepoint; return the error message, or None on success.
+
+        A statement failing to build is rolled back alone, the others of the
+        run still go through.
+        """
+        self.ensure_one()
         try:
-            response = requests.get(url, headers=config._get_headers(), params=params)
-            response.raise_for_status()
-            credits = response.json().get('data', [])
-            
-            for cred in credits:
-                self.env['customer.statement.line'].create({
-                    'statement_id': self.id,
-                    'date': cred['posting_date'],
-                    'line_type': 'credit',
-                    'reference': cred['name'],
-                    'description': f"Credit Note {cred['name']}",
-                    'amount': abs(cred['grand_total']),
-                })
-            
+            with self.env.cr.savepoint():
+                self._apply_erpnext_documents(documents_by_type)
         except Exception as e:
-            _logger.error(f"Failed to fetch credit notes: {str(e)}")
+            _logger.error(f"Failed to build statement {self.id}: {str(e)}")
+            return f'Failed to build statement lines: {str(e)}'
+        return None
+
+    def _apply_erpnext_documents(self, documents_by_type):
+        """Create the statement lines from {line type: documents} in one call, then finish the statement"""
+        self.ensure_one()
+        # Intermediate states must not drop a cached PDF the final content still matches
+        statement = self.with_context(defer_statement_pdf_cache=True)
+        vals_list = []
+        for line_type in STATEMENT_LINE_TYPES:
+            for doc in documents_by_type.get(line_type, []):
+                vals = self._prepare_line_vals(line_type, doc)
+                vals['statement_id'] = self.id
+                vals_list.append(vals)
+        statement.env['customer.statement.line'].create(vals_list)
+        _logger.info(f"Fetched {len(vals_list)} documents for {self.customer_id.name}")
+        
+        # Calculate aging
+        statement._calculate_aging()
+        
+        # Try to predict payment date
+        statement._predict_payment()
+        
+        statement.state = 'generated'
+        self._invalidate_pdf_cache()
+
+    @api.model
+    def _prepare_line_vals(self, line_type, doc):
+        """Statement line values of an ERPNext invoice, payment entry or credit note"""
+        if line_type == 'invoice':
+            return {
+                'date': doc['posting_date'],
+                'line_type': 'invoice',
+                'reference': doc['name'],
+                'description': f"Invoice {doc['name']}",
+                'amount': doc['grand_total'],
+                'outstanding': doc.get('outstanding_amount', 0),
+                'due_date': doc.get('due_date'),
+            }
+        if line_type == 'payment':
+            return {
+                'date': doc['posting_date'],
+                'line_type': 'payment',
+                'reference': doc['name'],
+                'description': f"Payment {doc.get('reference_no') or doc['name']}",
+                'amount': doc['paid_amount'],
+            }
+        return {
+            'date': doc['posting_date'],
+            'line_type': 'credit',
+            'reference': doc['name'],
+            'description': f"Credit Note {doc['name']}",
+            'amount': abs(doc['grand_total']),
+        }
 
     def _calculate_aging(self):
         """Calculate aging buckets for outstanding invoices"""
@@ -377,11 +578,206 @@ class CustomerStatement(models.Model):
         except Exception as e:
             _logger.warning(f"Payment prediction failed: {str(e)}")
 
+    def _get_render_fingerprint(self):
+        """Digest of everything the statement PDF shows: header, lines, aging buckets and template"""
+        self.ensure_one()
+        customer = self.customer_id
+        content = [
+            self.statement_number, customer.customer_name, customer.billing_address, customer.email, customer.phone,
+            str(self.date_from), str(self.date_to), self.currency_id.id, self.notes,
+            self.opening_balance, self.closing_balance, self.total_invoiced, self.total_paid, self.total_credits,
+            self.current_amount, self.days_30, self.days_60, self.days_90, self.days_90_plus,
+            str(self.predicted_payment_date), self.payment_confidence,
+            self.template_id.id, str(self.template_id.write_date), str(self.company_id.write_date),
+        ]
+        content.extend(
+            (str(line.date), line.line_type, line.reference, line.description, line.amount, line.running_balance)
+            for line in self.line_ids.sorted('date')
+        )
+        return hashlib.sha1(repr(content).encode()).hexdigest()[:12]
+
+    def _get_pdf_filename(self):
+        """File name the statement PDF is downloaded or sent under"""
+        self.ensure_one()
+        return f"Statement {self.statement_number} - {self.customer_id.customer_name}.pdf"
+
+    def _get_pdf_attachment_name(self):
+        """Name of the cached PDF attachment, keyed on the render fingerprint (also used by the report)"""
+        self.ensure_one()
+        return f"{PDF_CACHE_PREFIX}{self.id}-{self._get_render_fingerprint()}.pdf"
+
+    def _invalidate_pdf_cache(self):
+        """Delete the cached PDFs that no longer match their statement's content.
+
+        Only attachments named with PDF_CACHE_PREFIX are considered, so PDFs
+        uploaded by users or attached to sent emails are never touched.
+        """
+        if self.env.context.get('defer_statement_pdf_cache') or not self:
+            return
+        current = {statement.id: statement._get_pdf_attachment_name() for statement in self.exists()}
+        stale = self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_id', 'in', self.ids),
+            ('name', '=like', f'{PDF_CACHE_PREFIX}%'),
+        ]).filtered(lambda a: a.name != current.get(a.res_id))
+        if stale:
+            stale.unlink()
+            self.invalidate_recordset(['pdf_attachment_id'])
+
+    def _render_statement_pdfs(self, workers=RENDER_WORKERS, chunk_size=RENDER_CHUNK_SIZE):
+        """Attach the statements' PDFs, rendering chunk_size per wkhtmltopdf call on worker threads.
+
+        Statements whose cached PDF still matches their fingerprint are not
+        rendered again. Each worker renders through a cursor of its own, so
+        the statements must be committed beforehand; in test mode everything
+        is rendered in the current cursor. Only a few chunks are in memory at
+        a time, each stored as soon as it is done.
+        """
+        names = {statement.id: statement._get_pdf_attachment_name() for statement in self}
+        cached = {}
+        for attachment in self.env['ir.attachment'].search([
+            ('res_model', '=', self._name),
+            ('res_id', 'in', self.ids),
+            ('name', 'in', list(names.values())),
+        ]):
+            if names[attachment.res_id] == attachment.name:
+                cached[attachment.res_id] = attachment
+        for statement in self:
+            if statement.id in cached and statement.pdf_attachment_id != cached[statement.id]:
+                statement.pdf_attachment_id = cached[statement.id]
+        
+        pending = self.filtered(lambda s: s.id not in cached)
+        if cached:
+            _logger.info(f"Reusing {len(cached)} cached statement PDFs, rendering {len(pending)}")
+        chunks = [pending.ids[index:index + chunk_size] for index in range(0, len(pending), chunk_size)]
+        if self.env.registry.in_test_mode() or workers <= 1:
+            for statement_ids in chunks:
+                self._store_statement_pdfs(self._render_pdfs(self.env, statement_ids))
+            return
+        
+        args = (self.env.registry, self.env.uid, dict(self.env.context))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self._render_pdf_chunk, *args, statement_ids) for statement_ids in chunks]
+            for future in as_completed(futures):
+                self._store_statement_pdfs(future.result())
+
+    @staticmethod
+    def _render_pdf_chunk(registry, uid, context, statement_ids):
+        """Render a chunk of statements in a cursor of its own (worker thread)"""
+        with registry.cursor() as cr:
+            return CustomerStatement._render_pdfs(api.Environment(cr, uid, context), statement_ids)
+
+    @staticmethod
+    def _render_pdfs(env, statement_ids):
+        """Return {statement id: PDF bytes}, rendered with a single wkhtmltopdf call"""
+        streams = env['ir.actions.report'].with_context(report_pdf_no_attachment=True)._render_qweb_pdf_prepare_streams(
+            STATEMENT_REPORT, {}, res_ids=statement_ids
+        )
+        pdfs = {}
+        for statement_id, stream_data in streams.items():
+            if statement_id and stream_data['stream']:
+                pdfs[statement_id] = stream_data['stream'].getvalue()
+                stream_data['stream'].close()
+        return pdfs
+
+    def _store_statement_pdfs(self, pdfs):
+        """Attach {statement id: PDF bytes}, replacing each statement's outdated PDFs"""
+        statements = self.browse(list(pdfs))
+        attachments = self.env['ir.attachment'].create([{
+            'name': statement._get_pdf_attachment_name(),
+            'type': 'binary',
+            'raw': pdfs[statement.id],
+            'mimetype': 'application/pdf',
+            'res_model': self._name,
+            'res_id': statement.id,
+        } for statement in statements])
+        for statement, attachment in zip(statements, attachments):
+            statement.pdf_attachment_id = attachment
+        statements._invalidate_pdf_cache()
+        # Rendered PDFs can be large: do not keep them in the cache
+        attachments.invalidate_recordset(['raw', 'datas'])
+
+    def _build_pdf_bundle(self, name, record):
+        """Zip the statements' stored PDFs into one attachment of record, through a temporary file.
+
+        The zip is written to disk PDF by PDF and, with file storage, copied
+        into the filestore block by block; it is only loaded in memory when
+        attachments are stored in the database.
+        """
+        Attachment = self.env['ir.attachment']
+        entry_names = set()
+        with tempfile.TemporaryFile() as bundle_file:
+            with zipfile.ZipFile(bundle_file, 'w', zipfile.ZIP_STORED) as bundle:
+                for statement in self.filtered('pdf_attachment_id'):
+                    attachment = statement.pdf_attachment_id
+                    entry_name = statement._get_pdf_filename()
+                    if entry_name in entry_names:
+                        entry_name = f"{entry_name[:-4]} ({statement.id}).pdf"
+                    entry_names.add(entry_name)
+                    if attachment.store_fname:
+                        bundle.write(Attachment._full_path(attachment.store_fname), entry_name)
+                    else:
+                        bundle.writestr(entry_name, attachment.raw)
+                        attachment.invalidate_recordset(['raw', 'datas'])
+            
+            vals = {
+                'name': name,
+                'type': 'binary',
+                'mimetype': 'application/zip',
+                'res_model': record._name,
+                'res_id': record.id,
+            }
+            bundle_file.seek(0)
+            if Attachment._storage() != 'file':
+                return Attachment.create(dict(vals, raw=bundle_file.read()))
+            
+            checksum = hashlib.sha1()
+            for block in iter(lambda: bundle_file.read(BUNDLE_COPY_BLOCK), b''):
+                checksum.update(block)
+            checksum = checksum.hexdigest()
+            store_fname = f'{checksum[:2]}/{checksum}'
+            full_path = Attachment._full_path(store_fname)
+            if not os.path.isfile(full_path):
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                bundle_file.seek(0)
+                with open(full_path, 'wb') as stored_file:
+                    shutil.copyfileobj(bundle_file, stored_file, BUNDLE_COPY_BLOCK)
+            return Attachment.create(dict(
+                vals, store_fname=store_fname, checksum=checksum, file_size=os.path.getsize(full_path)
+            ))
+
     def action_print_statement(self):
         """Generate PDF statement"""
         self.ensure_one()
         return self.env.ref('CuStateGen.action_report_customer_statement').report_action(self)
 
+    def _send_statement_emails(self, workers=RENDER_WORKERS):
+        """Queue the statements' emails through the statement mail template.
+
+        PDFs are rendered in batches first; the template attaches the
+        statement report, which is then served from the render cache.
+        workers > 1 needs committed statements (see _render_statement_pdfs).
+        Returns the statements whose email could not be queued.
+        """
+        statements = self.filtered(lambda s: s.customer_id.email)
+        try:
+            statements._render_statement_pdfs(workers=workers)
+        except Exception as e:
+            # Each email renders its own PDF then
+            _logger.warning(f"Batch rendering of {len(statements)} statement PDFs failed: {str(e)}")
+        
+        template = self.env.ref(STATEMENT_MAIL_TEMPLATE)
+        failed = self.browse()
+        for statement in statements:
+            try:
+                with self.env.cr.savepoint():
+                    template.send_mail(statement.id)
+                    statement.state = 'sent'
+            except Exception as e:
+                _logger.error(f"Failed to send statement to {statement.customer_id.name}: {str(e)}")
+                failed |= statement
+        return failed
+
     def action_send_email(self):
         """Send statement via email"""
         self.ensure_one()
@@ -392,6 +788,7 @@ class CustomerStatement(models.Model):
         # Mark as sent
         self.state = 'sent'
         
+        # The template attaches the statement report, served from the render cache
         return {
             'type': 'ir.actions.act_window',
             'res_model': 'mail.compose.message',
@@ -401,5 +798,6 @@ class CustomerStatement(models.Model):
                 'default_model': 'customer.statement',
                 'default_res_id': self.id,
                 'default_partner_ids': [(4, self.customer_id.id)],
+                'default_template_id': self.env.ref(STATEMENT_MAIL_TEMPLATE).id,
             }
         }
\ No newline at end of file
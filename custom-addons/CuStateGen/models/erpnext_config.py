@@ -0,0 +1,11 @@
+from odoo import models, fields
+
+class ERPNextConfig(models.Model):
+    _inherit = 'erpnext.config'
+
+    customer_sync_modified = fields.Char(
+        string='Customers Synced Up To',
+        readonly=True,
+        help='ERPNext "modified" timestamp of the latest customer synced; '
+             'the next customer sync only fetches customers changed since then'
+    )
@@ -155,10 +155,7 @@ class MaterialAnalysis(models.Model):
 
     def _analyze_purchase_orders(self, config):
         """Fetch purchase orders from ERPNext and aggregate by material"""
-        import requests
-        
         # Fetch Purchase Invoices
-        url = f"{config.base_url}/api/resource/Purchase Invoice"
         filters = {
             'posting_date': ['between', [
                 self.date_from.strftime('%Y-%m-%d'),
@@ -166,23 +163,18 @@ class MaterialAnalysis(models.Model):
             ]],
             'docstatus': 1
         }
-        params = {
-            'filters': str(filters),
-            'fields': '["name", "supplier", "posting_date", "grand_total"]'
-        }
+        fields_list = ['name', 'supplier', 'posting_date', 'grand_total']
         
         try:
-            response = requests.get(url, headers=config._get_headers(), params=params)
-            response.raise_for_status()
-            invoices = response.json().get('data', [])
-            
-            _logger.info(f"Found {len(invoices)} purchase invoices")
-            
             # For each invoice, fetch items
             material_data = {}  # {material_code: {data}}
             
-            for invoice in invoices:
+            invoice_count = 0
+            for invoice in config._get_client().iter_list('Purchase Invoice', fields_list, filters):
                 self._fetch_invoice_items(config, invoice, material_data)
+                invoice_count += 1
+            
+            _logger.info(f"Found {invoice_count} purchase invoices")
             
             # Create analysis lines
             for material_code, data in material_data.items():
@@ -206,14 +198,10 @@ class MaterialAnalysis(models.Model):
 
     def _fetch_invoice_items(self, config, invoice, material_data):
         """Fetch items from a purchase invoice"""
-        import requests
-        
-        url = f"{config.base_url}/api/resource/Purchase Invoice/{invoice['name']}"
+        path = f"/api/resource/Purchase Invoice/{invoice['name']}"
         
         try:
-            response = requests.get(url, headers=config._get_headers())
-            response.raise_for_status()
-            invoice_data = response.json().get('data', {})
+            invoice_data = config._get_client().get(path).get('data', {})
             
             items = invoice_data.get('items', [])
             supplier = invoice_data.get('supplier')
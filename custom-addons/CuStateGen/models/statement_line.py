@@ -57,6 +57,23 @@ class CustomerStatementLine(models.Model):
         store=True
     )
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        lines.statement_id._invalidate_pdf_cache()
+        return lines
+
+    def write(self, vals):
+        res = super().write(vals)
+        self.statement_id._invalidate_pdf_cache()
+        return res
+
+    def unlink(self):
+        statements = self.statement_id
+        res = super().unlink()
+        statements._invalidate_pdf_cache()
+        return res
+
     @api.depends('due_date')
     def _compute_days_overdue(self):
         today = fields.Date.today()
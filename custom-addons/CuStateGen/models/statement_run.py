@@ -0,0 +1,286 @@
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+from odoo.tools import config as odoo_config
+from .customer_statement import RENDER_CHUNK_SIZE, RENDER_WORKERS
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Seconds one cron run keeps processing chunks before handing over to the next run, at most
+RUN_TIME_BUDGET = 240
+# Share of the cron worker's real time limit spent starting chunks; the rest is
+# the margin for the chunk still running when the budget runs out
+RUN_TIME_LIMIT_SHARE = 0.5
+
+
+def _run_time_budget():
+    """Seconds a cron run may keep starting chunks without being killed by the worker time limit"""
+    limit = odoo_config.get('limit_time_real_cron', -1)
+    if limit is None or limit < 0:
+        # Crons fall back to the HTTP workers' limit
+        limit = odoo_config.get('limit_time_real', 0)
+    if not limit:
+        return RUN_TIME_BUDGET
+    return min(RUN_TIME_BUDGET, limit * RUN_TIME_LIMIT_SHARE)
+
+class CustomerStatementRun(models.Model):
+    _name = 'customer.statement.run'
+    _description = 'Background Statement Generation Run'
+    _order = 'create_date desc'
+
+    name = fields.Char(string='Run', required=True, default='New')
+    date_from = fields.Date(string='From Date', required=True)
+    date_to = fields.Date(string='To Date', required=True)
+    template_id = fields.Many2one('statement.template', string='Template')
+    auto_send_email = fields.Boolean(string='Auto-send via Email')
+    render_pdfs = fields.Boolean(
+        string='Render PDFs',
+        help='Once all statements are generated, render their PDFs in parallel batches and bundle them in a zip'
+    )
+    pdf_bundle_id = fields.Many2one('ir.attachment', string='PDF Bundle', readonly=True, copy=False)
+
+    customer_ids = fields.Many2many(
+        'customer.account',
+        'customer_statement_run_customer_rel',
+        'run_id',
+        'customer_id',
+        string='Customers'
+    )
+    statement_ids = fields.Many2many(
+        'customer.statement',
+        'customer_statement_run_statement_rel',
+        'run_id',
+        'statement_id',
+        string='Generated Statements',
+        readonly=True
+    )
+    chunk_size = fields.Integer(
+        string='Customers per Chunk',
+        default=50,
+        help='Customers processed and committed together; an interrupted run resumes after the last committed chunk'
+    )
+
+    # Progress
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ], string='Status', default='draft', required=True, readonly=True)
+    next_index = fields.Integer(
+        string='Customers Processed',
+        readonly=True,
+        help='Position in the customer list (ordered by id) where the next chunk starts'
+    )
+    customer_count = fields.Integer(string='Customers', compute='_compute_progress')
+    progress = fields.Float(string='Progress (%)', compute='_compute_progress')
+    mailing_index = fields.Integer(
+        string='Statements Emailed',
+        readonly=True,
+        help='Position in the generated statements (ordered by id) where the next email batch starts'
+    )
+    generated_count = fields.Integer(string='Generated', readonly=True)
+    failed_count = fields.Integer(string='Failed', readonly=True)
+    progress_log = fields.Text(string='Progress Log', readonly=True)
+
+    @api.depends('customer_ids', 'next_index')
+    def _compute_progress(self):
+        for record in self:
+            record.customer_count = len(record.customer_ids)
+            record.progress = (
+                100.0 * min(record.next_index, record.customer_count) / record.customer_count
+                if record.customer_count else 0.0
+            )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            if vals.get('name', 'New') == 'New':
+                vals['name'] = f"Statements {vals.get('date_from')} - {vals.get('date_to')}"
+        return super().create(vals_list)
+
+    def action_start(self):
+        """Queue the run for the background worker, resuming after the last completed chunk"""
+        for record in self:
+            if not record.customer_ids:
+                raise UserError('Please select at least one customer.')
+        self.filtered(lambda r: r.state != 'done').write({'state': 'running'})
+        for record in self:
+            record._log(f"Queued at customer {record.next_index} of {record.customer_count}")
+        self._trigger_worker()
+
+    def _trigger_worker(self):
+        """Wake up the statement run cron"""
+        cron = self.env.ref('CuStateGen.cron_process_statement_runs', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    def _log(self, message):
+        """Append a timestamped line to the progress log"""
+        self.ensure_one()
+        line = f"{fields.Datetime.now()}  {message}"
+        self.progress_log = f"{self.progress_log}\n{line}" if self.progress_log else line
+
+    @api.model
+    def _cron_process_runs(self):
+        """Process running runs one committed chunk at a time until the time budget is spent.
+
+        Each chunk locks its run with FOR UPDATE SKIP LOCKED, so several
+        workers can share the runs without processing one chunk twice.
+        """
+        started = time.monotonic()
+        budget = _run_time_budget()
+        while time.monotonic() - started < budget:
+            self.env.cr.execute(f"""
+                SELECT id FROM {self._table}
+                 WHERE state = 'running'
+                 ORDER BY id
+                 LIMIT 1
+                   FOR UPDATE SKIP LOCKED
+            """)
+            row = self.env.cr.fetchone()
+            if not row:
+                return
+            
+            run = self.browse(row[0])
+            try:
+                run._process_next_chunk()
+            except Exception as e:
+                _logger.error(f"Statement run {run.id} failed: {str(e)}")
+                self.env.cr.rollback()
+                run.state = 'failed'
+                run._log(f"Chunk at customer {run.next_index} failed: {str(e)}; resume to retry it")
+            
+            if self.env.registry.in_test_mode():
+                return
+            self.env.cr.commit()
+        
+        # Out of time with work left: continue in a fresh cron run
+        self._trigger_worker()
+
+    def _process_next_chunk(self):
+        """Generate the statements of the next chunk of customers and record the progress"""
+        self.ensure_one()
+        config = self.env['erpnext.config'].search([('active', '=', True)], limit=1)
+        if not config:
+            raise UserError('No active ERPNext configuration found.')
+        
+        customers = self.customer_ids.sorted('id')
+        chunk = customers[self.next_index:self.next_index + max(self.chunk_size, 1)]
+        if not chunk:
+            if self.render_pdfs and self._render_next_pdfs():
+                return
+            if self.auto_send_email and self._send_next_emails():
+                return
+            self._finish()
+            return
+        
+        try:
+            with self.env.cr.savepoint():
+                generated, failed = self._generate_statements(chunk, config)
+        except Exception as e:
+            # Isolate the culprits so the chunk still moves forward
+            _logger.warning(f"Statement run {self.id}: chunk failed, retrying its customers one by one: {str(e)}")
+            generated = self.env['customer.statement']
+            failed = 0
+            for customer in chunk:
+                try:
+                    with self.env.cr.savepoint():
+                        customer_generated, customer_failed = self._generate_statements(customer, config)
+                    generated |= customer_generated
+                    failed += customer_failed
+                except Exception as e:
+                    _logger.error(f"Failed to generate the statement of {customer.name}: {str(e)}")
+                    failed += 1
+        
+        self.write({
+            'next_index': self.next_index + len(chunk),
+            'generated_count': self.generated_count + len(generated),
+            'failed_count': self.failed_count + failed,
+            'statement_ids': [(4, statement.id) for statement in generated],
+        })
+        self._log(
+            f"Customers {self.next_index - len(chunk) + 1}-{self.next_index} of {len(customers)}: "
+            f"{len(generated)} generated, {failed} failed"
+        )
+
+    def _generate_statements(self, customers, config):
+        """Generate the run's statements of these customers; returns (generated statements, failed count)"""
+        statements = self.env['customer.statement']._prepare_statements(
+            customers, self.date_from, self.date_to, self.template_id
+        )
+        errors = statements._fetch_lines_from_erpnext(config)
+        for statement_id, error in errors.items():
+            _logger.error(f"Failed to generate statement {statement_id}: {error}")
+        return statements.filtered(lambda s: s.id not in errors), len(errors)
+
+    def _render_next_pdfs(self):
+        """Render the next batch of generated statements still without a PDF; False when none are left.
+
+        The statements were committed by earlier chunks, so the batch is
+        rendered by parallel workers with cursors of their own.
+        """
+        self.ensure_one()
+        pending = self.statement_ids.filtered(lambda s: not s.pdf_attachment_id)
+        batch = pending[:RENDER_CHUNK_SIZE * RENDER_WORKERS]
+        if not batch:
+            return False
+        
+        batch._render_statement_pdfs()
+        missing = batch.filtered(lambda s: not s.pdf_attachment_id)
+        if missing:
+            raise UserError(f"No PDF was produced for statements {', '.join(missing.mapped('statement_number'))}")
+        self._log(f"Rendered {len(batch)} PDFs, {len(pending) - len(batch)} left")
+        return True
+
+    def _send_next_emails(self):
+        """Email the next batch of generated statements; False when all have been handled.
+
+        Runs once every statement is generated and committed, so the PDFs
+        are rendered in parallel batches before the emails are queued.
+        """
+        self.ensure_one()
+        statements = self.statement_ids.sorted('id')
+        batch = statements[self.mailing_index:self.mailing_index + RENDER_CHUNK_SIZE * RENDER_WORKERS]
+        if not batch:
+            return False
+        
+        failed = batch._send_statement_emails()
+        self.mailing_index += len(batch)
+        self._log(
+            f"Emailed {len(batch.filtered(lambda s: s.customer_id.email)) - len(failed)} statements, "
+            f"{len(failed)} failed, {len(statements) - self.mailing_index} left"
+        )
+        return True
+
+    def _finish(self):
+        """Bundle the rendered PDFs if requested and mark the run done"""
+        self.ensure_one()
+        if self.render_pdfs and self.statement_ids:
+            self.pdf_bundle_id.unlink()
+            self.pdf_bundle_id = self.statement_ids._build_pdf_bundle(f'{self.name}.zip', self)
+        self.state = 'done'
+        self._log(f"Done: {self.generated_count} generated, {self.failed_count} failed")
+
+    def action_download_pdfs(self):
+        """Download the zip of the run's statement PDFs"""
+        self.ensure_one()
+        if not self.pdf_bundle_id:
+            raise UserError('The PDFs of this run have not been rendered yet.')
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/web/content/{self.pdf_bundle_id.id}?download=true',
+            'target': 'self',
+        }
+
+    def action_view_statements(self):
+        """Open the statements generated so far"""
+        self.ensure_one()
+        return {
+            'name': 'Generated Statements',
+            'type': 'ir.actions.act_window',
+            'res_model': 'customer.statement',
+            'view_mode': 'tree,form',
+            'domain': [('id', 'in', self.statement_ids.ids)],
+        }
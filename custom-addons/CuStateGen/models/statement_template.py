@@ -52,4 +52,8 @@ class StatementTemplate(models.Model):
         # If marked as default, unset other defaults
         if vals.get('is_default'):
             self.search([('is_default', '=', True), ('id', 'not in', self.ids)]).write({'is_default': False})
-        return super().write(vals)
\ No newline at end of file
+        res = super().write(vals)
+        # Cached statement PDFs rendered with the previous template content are outdated
+        if set(vals) - {'name', 'is_default', 'active'}:
+            self.env['customer.statement'].search([('template_id', 'in', self.ids)])._invalidate_pdf_cache()
+        return res
\ No newline at end of file
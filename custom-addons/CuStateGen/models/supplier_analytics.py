@@ -94,10 +94,7 @@ class SupplierAnalytics(models.Model):
         if not config:
             raise UserError('No active ERPNext configuration found.')
         
-        import requests
-        
         # Fetch all purchase invoices in range
-        url = f"{config.base_url}/api/resource/Purchase Invoice"
         filters = {
             'posting_date': ['between', [
                 date_from.strftime('%Y-%m-%d'),
@@ -105,15 +102,10 @@ class SupplierAnalytics(models.Model):
             ]],
             'docstatus': 1
         }
-        params = {
-            'filters': str(filters),
-            'fields': '["name", "supplier", "grand_total", "posting_date"]'
-        }
+        fields_list = ['name', 'supplier', 'grand_total', 'posting_date']
         
         try:
-            response = requests.get(url, headers=config._get_headers(), params=params)
-            response.raise_for_status()
-            invoices = response.json().get('data', [])
+            invoices = config._get_client().iter_list('Purchase Invoice', fields_list, filters)
             
             # Aggregate by supplier
             supplier_data = {}
@@ -23,6 +23,10 @@ class BulkSyncWizard(models.TransientModel):
         string='Filter by Customer Group',
         help='Only sync customers from this group'
     )
+    full_resync = fields.Boolean(
+        string='Full Resync',
+        help='Fetch every customer instead of only those changed since the last sync'
+    )
     
     # Statement Options
     date_from = fields.Date(string='From Date')
@@ -34,8 +38,15 @@ class BulkSyncWizard(models.TransientModel):
         default=6
     )
     
+    run_in_background = fields.Boolean(
+        string='Run in Background',
+        help='Generate the statements in committed chunks by a background worker, with live progress'
+    )
+    
     # Progress Tracking
-    progress_log = fields.Text(string='Progress Log', readonly=True)
+    run_id = fields.Many2one('customer.statement.run', string='Statement Run', readonly=True)
+    progress = fields.Float(related='run_id.progress', string='Progress (%)')
+    progress_log = fields.Text(related='run_id.progress_log', string='Progress Log')
 
     def action_start_sync(self):
         """Start the bulk sync process"""
@@ -56,53 +67,13 @@ class BulkSyncWizard(models.TransientModel):
         if not config:
             raise UserError('No active ERPNext configuration found.')
         
-        import requests
-        
-        url = f"{config.base_url}/api/resource/Customer"
-        params = {
-            'fields': '["name", "customer_name", "email_id", "customer_group", "territory"]',
-            'limit_page_length': 0  # Get all
-        }
-        
-        # Apply filter if specified
-        if self.customer_group_filter:
-            params['filters'] = f'{{"customer_group": "{self.customer_group_filter}"}}'
-        
         try:
-            response = requests.get(url, headers=config._get_headers(), params=params)
-            response.raise_for_status()
-            customers = response.json().get('data', [])
-            
-            created = 0
-            updated = 0
-            errors = 0
-            
-            for customer_data in customers:
-                try:
-                    existing = self.env['customer.account'].search([
-                        ('erpnext_customer_id', '=', customer_data['name'])
-                    ])
-                    
-                    vals = {
-                        'name': customer_data['name'],
-                        'customer_name': customer_data.get('customer_name', customer_data['name']),
-                        'erpnext_customer_id': customer_data['name'],
-                        'email': customer_data.get('email_id'),
-                        'customer_group': customer_data.get('customer_group'),
-                        'territory': customer_data.get('territory'),
-                        'last_sync_date': fields.Datetime.now(),
-                    }
-                    
-                    if existing:
-                        existing.write(vals)
-                        updated += 1
-                    else:
-                        self.env['customer.account'].create(vals)
-                        created += 1
-                        
-                except Exception as e:
-                    _logger.error(f"Failed to sync customer {customer_data.get('name')}: {str(e)}")
-                    errors += 1
+            # Only customers changed since the last sync, applied page by page
+            created, updated, errors = self.env['customer.account']._sync_customers_from_erpnext(
+                config,
+                customer_group=self.customer_group_filter or None,
+                full=self.full_resync,
+            )
             
             return {
                 'type': 'ir.actions.client',
@@ -131,34 +102,35 @@ class BulkSyncWizard(models.TransientModel):
         if not customers:
             raise UserError('No customers found. Please sync customers first.')
         
-        generated = 0
-        failed = 0
+        if self.run_in_background:
+            self.run_id = self.env['customer.statement.run'].create({
+                'date_from': self.date_from,
+                'date_to': self.date_to,
+                'customer_ids': [(6, 0, customers.ids)],
+            })
+            self.run_id.action_start()
+            # Reopen the wizard on its run's live progress
+            return {
+                'name': 'Bulk Operations',
+                'type': 'ir.actions.act_window',
+                'res_model': 'bulk.sync.wizard',
+                'res_id': self.id,
+                'view_mode': 'form',
+                'target': 'new',
+            }
+        
+        config = self.env['erpnext.config'].search([('active', '=', True)], limit=1)
+        if not config:
+            raise UserError('No active ERPNext configuration found.')
+        
+        statements = self.env['customer.statement']._prepare_statements(customers, self.date_from, self.date_to)
         
-        for customer in customers:
-            try:
-                # Check for existing statement
-                existing = self.env['customer.statement'].search([
-                    ('customer_id', '=', customer.id),
-                    ('date_from', '=', self.date_from),
-                    ('date_to', '=', self.date_to)
-                ])
-                
-                if existing:
-                    statement = existing[0]
-                    statement.line_ids.unlink()
-                else:
-                    statement = self.env['customer.statement'].create({
-                        'customer_id': customer.id,
-                        'date_from': self.date_from,
-                        'date_to': self.date_to,
-                    })
-                
-                statement.action_fetch_from_erpnext()
-                generated += 1
-                
-            except Exception as e:
-                _logger.error(f"Failed for {customer.name}: {str(e)}")
-                failed += 1
+        # Concurrent per-customer fetches, or one stream per list for large runs
+        errors = statements._fetch_lines_from_erpnext(config)
+        for statement_id, error in errors.items():
+            _logger.error(f"Failed for statement {statement_id}: {error}")
+        failed = len(errors)
+        generated = len(statements) - failed
         
         return {
             'type': 'ir.actions.client',
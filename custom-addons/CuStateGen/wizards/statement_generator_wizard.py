@@ -2,6 +2,10 @@ from odoo import models, fields, api
 from odoo.exceptions import UserError
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
+from ..models.customer_statement import RENDER_CHUNK_SIZE
+import logging
+
+_logger = logging.getLogger(__name__)
 
 class StatementGeneratorWizard(models.TransientModel):
     _name = 'statement.generator.wizard'
@@ -65,7 +69,12 @@ class StatementGeneratorWizard(models.TransientModel):
     )
     auto_download_pdf = fields.Boolean(
         string='Download PDFs',
-        default=True
+        default=True,
+        help='More than 25 statements are generated by a background run, which bundles their PDFs in a zip'
+    )
+    run_in_background = fields.Boolean(
+        string='Run in Background',
+        help='Generate the statements in committed chunks by a background worker, with live progress'
     )
 
     @api.onchange('period_type')
@@ -110,40 +119,46 @@ class StatementGeneratorWizard(models.TransientModel):
         if not customers:
             raise UserError('Please select at least one customer.')
         
-        generated_statements = self.env['customer.statement']
-        
-        for customer in customers:
-            # Check for existing statement
-            existing = self.env['customer.statement'].search([
-                ('customer_id', '=', customer.id),
-                ('date_from', '=', self.date_from),
-                ('date_to', '=', self.date_to)
-            ])
-            
-            if existing:
-                statement = existing[0]
-                statement.line_ids.unlink()  # Refresh data
-            else:
-                statement = self.env['customer.statement'].create({
-                    'customer_id': customer.id,
-                    'date_from': self.date_from,
-                    'date_to': self.date_to,
-                    'template_id': self.template_id.id,
-                })
-            
-            # Fetch data from ERPNext
-            try:
-                statement.action_fetch_from_erpnext()
-                generated_statements |= statement
-                
-                # Auto-send email if requested
-                if self.auto_send_email and customer.email:
-                    statement.action_send_email()
-                    
-            except Exception as e:
-                # Log error but continue with other customers
-                _logger.error(f"Failed to generate statement for {customer.name}: {str(e)}")
-                continue
+        # Too many PDFs to render within the request: a background run renders
+        # them in parallel batches and bundles them in a zip
+        if self.run_in_background or (self.auto_download_pdf and len(customers) > RENDER_CHUNK_SIZE):
+            run = self.env['customer.statement.run'].create({
+                'date_from': self.date_from,
+                'date_to': self.date_to,
+                'template_id': self.template_id.id,
+                'auto_send_email': self.auto_send_email,
+                'render_pdfs': self.auto_download_pdf,
+                'customer_ids': [(6, 0, customers.ids)],
+            })
+            run.action_start()
+            return {
+                'name': 'Statement Run',
+                'type': 'ir.actions.act_window',
+                'res_model': 'customer.statement.run',
+                'res_id': run.id,
+                'view_mode': 'form',
+                'target': 'current',
+            }
+        
+        config = self.env['erpnext.config'].search([('active', '=', True)], limit=1)
+        if not config:
+            raise UserError('No active ERPNext configuration found.')
+        
+        statements = self.env['customer.statement']._prepare_statements(
+            customers, self.date_from, self.date_to, self.template_id
+        )
+        
+        # Fetch data from ERPNext: concurrently per customer, or in bulk for large runs
+        errors = statements._fetch_lines_from_erpnext(config)
+        for statement_id, error in errors.items():
+            # Log error but continue with other customers
+            _logger.error(f"Failed to generate statement {statement_id}: {error}")
+        generated_statements = statements.filtered(lambda s: s.id not in errors)
+        
+        # Auto-send email if requested
+        if self.auto_send_email:
+            # Not committed yet: the PDFs are rendered in this cursor
+            generated_statements._send_statement_emails(workers=1)
         
         if not generated_statements:
             raise UserError('No statements were generated. Check ERPNext connection.')
@@ -1,4 +1,5 @@
 from . import expense_forecast
 from . import expense_analytics
 from . import cashflow_projection
-from . import bank_transaction_insights
\ No newline at end of file
+from . import bank_transaction_insights
+from . import category_stats
\ No newline at end of file
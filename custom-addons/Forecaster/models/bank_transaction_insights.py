@@ -1,10 +1,37 @@
 from odoo import models, fields, api
+from odoo.tools import sql
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 import logging
+import math
+import re
 
 _logger = logging.getLogger(__name__)
 
+# Amount buckets grow by 10%, so amounts within 10% of each other are at
+# most two buckets below or one above (log_1.1(0.9) is about -1.1)
+AMOUNT_BUCKET_BASE = math.log(1.1)
+SIMILAR_LIMIT = 20
+# Insight fields of a transaction that depend on its similar transactions
+SIMILARITY_FIELDS = ('is_recurring', 'is_unusual', 'spending_pattern')
+
+
+def merchant_key(description):
+    """Normalised merchant of a description: its first three words longer than three letters.
+
+    Digits and punctuation are dropped, so card numbers, dates and
+    reference numbers do not split one merchant into many.
+    """
+    words = [w for w in re.findall(r'[a-z]+', (description or '').lower()) if len(w) > 3]
+    return ' '.join(words[:3]) or False
+
+
+def amount_bucket(amount):
+    """Logarithmic bucket of an amount, False for zero"""
+    if not amount:
+        return False
+    return math.floor(math.log(abs(amount)) / AMOUNT_BUCKET_BASE)
+
 class BankTransactionInsights(models.Model):
     _inherit = 'bank.transaction'
 
@@ -17,6 +44,10 @@ class BankTransactionInsights(models.Model):
         ('one_time', 'One-time')
     ], string='Pattern', compute='_compute_insights', store=True)
     similar_transaction_count = fields.Integer(string='Similar Transactions', compute='_compute_similar_count')
+    # Similarity index: transactions are similar when they share the merchant
+    # key and their amounts differ by less than 10%
+    merchant_key = fields.Char(string='Merchant Key', compute='_compute_similarity_key', store=True, index='trigram')
+    amount_bucket = fields.Integer(string='Amount Bucket', compute='_compute_similarity_key', store=True)
     forecast_variance = fields.Monetary(
         string='vs Forecast',
         currency_field='currency_id',
@@ -28,23 +59,81 @@ class BankTransactionInsights(models.Model):
         ('high', 'High Risk')
     ], string='Risk Level', compute='_compute_risk_level', store=True)
 
-    @api.depends('description', 'amount', 'date')
+    def init(self):
+        super().init()
+        sql.create_index(
+            self._cr, 'bank_transaction_similarity_idx', self._table, ['merchant_key', 'amount_bucket']
+        )
+        # Most recent similar transactions first, see _get_similar_map and _get_similarity_neighbours
+        sql.create_index(
+            self._cr, 'bank_transaction_similarity_date_idx', self._table, ['merchant_key', 'date DESC', 'id DESC']
+        )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.env['transaction.category.stats'].apply_deltas(records._category_stats_deltas())
+        # Only the existing transactions similar to the new ones change
+        records._get_similarity_neighbours()._mark_similar_insights()
+        return records
+
+    def write(self, vals):
+        stats_changed = 'category_id' in vals or 'amount' in vals
+        similarity_changed = any(fname in vals for fname in ('description', 'amount', 'date'))
+        if not stats_changed and not similarity_changed:
+            return super().write(vals)
+        
+        old_deltas = self._category_stats_deltas(-1) if stats_changed else {}
+        # Both the old and the new neighbours of a changed transaction are affected
+        neighbours = self._get_similarity_neighbours() if similarity_changed else self.browse()
+        res = super().write(vals)
+        
+        if stats_changed:
+            deltas = self._category_stats_deltas()
+            for category_id, (count, amount_sum, amount_sq_sum) in old_deltas.items():
+                delta = deltas.setdefault(category_id, [0, 0.0, 0.0])
+                delta[0] += count
+                delta[1] += amount_sum
+                delta[2] += amount_sq_sum
+            self.env['transaction.category.stats'].apply_deltas(deltas)
+        if similarity_changed:
+            (neighbours | self._get_similarity_neighbours())._mark_similar_insights()
+        return res
+
+    def unlink(self):
+        self.env['transaction.category.stats'].apply_deltas(self._category_stats_deltas(-1))
+        neighbours = self._get_similarity_neighbours()
+        res = super().unlink()
+        neighbours.exists()._mark_similar_insights()
+        return res
+
+    @api.depends('description', 'amount')
+    def _compute_similarity_key(self):
+        for record in self:
+            record.merchant_key = merchant_key(record.description)
+            record.amount_bucket = amount_bucket(record.amount)
+
+    @api.depends('description', 'amount', 'date', 'merchant_key', 'amount_bucket')
     def _compute_insights(self):
+        # Running category totals: one lookup for the batch, O(1) per record
+        category_stats = self.env['transaction.category.stats'].get_stats(self.category_id)
+        similar_map = self._get_similar_map()
+        
         for record in self:
             # Check if recurring
-            similar_trans = self._find_similar_transactions(record)
+            similar_trans = similar_map[record.id]
             record.is_recurring = len(similar_trans) >= 3
             
             # Check if unusual
             if record.category_id:
-                category_trans = self.search([
-                    ('category_id', '=', record.category_id.id),
-                    ('id', '!=', record.id)
-                ])
-                if category_trans:
-                    amounts = [abs(t.amount) for t in category_trans]
-                    avg = sum(amounts) / len(amounts)
-                    std_dev = (sum((x - avg) ** 2 for x in amounts) / len(amounts)) ** 0.5
+                count, amount_sum, amount_sq_sum = category_stats[record.category_id.id]
+                if record.id:
+                    # Saved transactions are in the totals, compare against the others
+                    own = abs(record.amount)
+                    count, amount_sum, amount_sq_sum = count - 1, amount_sum - own, amount_sq_sum - own ** 2
+                if count > 0:
+                    avg = amount_sum / count
+                    std_dev = max(amount_sq_sum / count - avg ** 2, 0.0) ** 0.5
                     record.is_unusual = abs(record.amount) > (avg + 2 * std_dev)
                 else:
                     record.is_unusual = False
@@ -70,6 +159,17 @@ class BankTransactionInsights(models.Model):
             else:
                 record.spending_pattern = 'one_time'
 
+    def _category_stats_deltas(self, sign=1):
+        """Return {category id: [count, sum, sum of squares]} of these transactions, times sign"""
+        deltas = {}
+        for record in self.filtered('category_id'):
+            amount = abs(record.amount)
+            delta = deltas.setdefault(record.category_id.id, [0, 0.0, 0.0])
+            delta[0] += sign
+            delta[1] += sign * amount
+            delta[2] += sign * amount ** 2
+        return deltas
+
     @api.depends('is_unusual', 'is_recurring', 'category_id')
     def _compute_risk_level(self):
         for record in self:
@@ -81,36 +181,106 @@ class BankTransactionInsights(models.Model):
                 record.risk_level = 'low'
 
     def _compute_similar_count(self):
+        similar_map = self._get_similar_map()
         for record in self:
-            similar = self._find_similar_transactions(record)
-            record.similar_transaction_count = len(similar)
+            record.similar_transaction_count = len(similar_map[record.id])
 
     def _find_similar_transactions(self, transaction):
         """Find transactions similar to this one"""
-        if not transaction.description:
+        key = merchant_key(transaction.description)
+        if not key:
             return self.env['bank.transaction']
         
-        # Split description into words
-        words = transaction.description.lower().split()
-        significant_words = [w for w in words if len(w) > 3][:3]  # Top 3 words
-        
-        if not significant_words:
-            return self.env['bank.transaction']
+        # Same merchant, amount within 10%: served by the similarity index
+        domain = [('id', '!=', transaction.id), ('merchant_key', '=', key)]
+        bucket = amount_bucket(transaction.amount)
+        if bucket is not False:
+            domain += [('amount_bucket', '>=', bucket - 2), ('amount_bucket', '<=', bucket + 1)]
+        similar = self.search(domain)
         
-        # Search for transactions with similar descriptions
-        domain = [('id', '!=', transaction.id)]
-        for word in significant_words:
-            domain.append(('description', 'ilike', word))
-        
-        similar = self.search(domain, limit=20)
-        
-        # Filter by similar amount (within 10%)
         if transaction.amount != 0:
             similar = similar.filtered(
                 lambda t: abs(abs(t.amount) - abs(transaction.amount)) / abs(transaction.amount) < 0.1
             )
         
-        return similar
+        return similar[:SIMILAR_LIMIT]
+
+    def _get_similar_map(self):
+        """Return {record id: similar transactions} for the whole recordset.
+
+        Saved records are resolved with one indexed self-join; new records
+        (onchange) fall back to _find_similar_transactions.
+        """
+        similar_ids = {record.id: [] for record in self}
+        saved = self.filtered('id')
+        for record in self - saved:
+            similar_ids[record.id] = self._find_similar_transactions(record).ids
+        
+        if saved:
+            self.flush_model(['description', 'amount', 'date', 'merchant_key', 'amount_bucket'])
+            self.env.cr.execute(f"""
+                SELECT t.id, s.id
+                  FROM {self._table} t
+                  CROSS JOIN LATERAL (
+                      SELECT s.id
+                        FROM {self._table} s
+                       WHERE s.merchant_key = t.merchant_key
+                         AND s.id != t.id
+                         AND (t.amount_bucket IS NULL
+                              OR (s.amount_bucket BETWEEN t.amount_bucket - 2 AND t.amount_bucket + 1
+                                  AND ABS(ABS(s.amount) - ABS(t.amount)) < 0.1 * ABS(t.amount)))
+                       ORDER BY s.date DESC, s.id DESC
+                       LIMIT %s
+                  ) s
+                 WHERE t.id IN %s
+                   AND t.merchant_key IS NOT NULL
+            """, [SIMILAR_LIMIT, tuple(saved.ids)])
+            for record_id, similar_id in self.env.cr.fetchall():
+                similar_ids[record_id].append(similar_id)
+        
+        return {record_id: self.browse(ids) for record_id, ids in similar_ids.items()}
+
+    def _get_similarity_neighbours(self):
+        """Saved transactions that count these ones among their similar transactions.
+
+        A transaction only sees its SIMILAR_LIMIT most recent similar
+        transactions, so a neighbour is kept only when fewer than
+        SIMILAR_LIMIT of its similar transactions are newer than this one.
+        """
+        saved = self.filtered('id')
+        if not saved:
+            return self.browse()
+        self.flush_model(['amount', 'date', 'merchant_key', 'amount_bucket'])
+        # Same similarity test as _get_similar_map, seen from the neighbour n
+        similar_to_n = """
+            (n.amount_bucket IS NULL
+             OR ({row}.amount_bucket BETWEEN n.amount_bucket - 2 AND n.amount_bucket + 1
+                 AND ABS(ABS({row}.amount) - ABS(n.amount)) < 0.1 * ABS(n.amount)))
+        """
+        self.env.cr.execute(f"""
+            SELECT DISTINCT n.id
+              FROM {self._table} t
+              JOIN {self._table} n
+                ON n.merchant_key = t.merchant_key
+               AND {similar_to_n.format(row='t')}
+             WHERE t.id IN %s
+               AND n.id NOT IN %s
+               AND (SELECT COUNT(*)
+                      FROM (SELECT 1
+                              FROM {self._table} s
+                             WHERE s.merchant_key = n.merchant_key
+                               AND s.id != n.id
+                               AND s.id != t.id
+                               AND {similar_to_n.format(row='s')}
+                               AND (s.date, s.id) > (t.date, t.id)
+                             LIMIT %s) newer) < %s
+        """, [tuple(saved.ids), tuple(saved.ids), SIMILAR_LIMIT, SIMILAR_LIMIT])
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+
+    def _mark_similar_insights(self):
+        """Queue the similarity-based insights of these transactions for recomputation"""
+        for fname in SIMILARITY_FIELDS:
+            self.env.add_to_compute(self._fields[fname], self)
 
     def action_view_similar_transactions(self):
         """View similar transactions"""
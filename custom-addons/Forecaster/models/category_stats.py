@@ -0,0 +1,73 @@
+from odoo import models, fields, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+class TransactionCategoryStats(models.Model):
+    _name = 'transaction.category.stats'
+    _description = 'Transaction Category Statistics'
+    _log_access = False
+
+    category_id = fields.Many2one('transaction.category', string='Category', required=True, ondelete='cascade')
+    transaction_count = fields.Integer(string='Transactions', readonly=True)
+    amount_sum = fields.Float(string='Sum of Amounts', readonly=True)
+    amount_sq_sum = fields.Float(string='Sum of Squared Amounts', readonly=True)
+
+    _sql_constraints = [
+        ('category_unique', 'UNIQUE(category_id)', 'Statistics already exist for this category!')
+    ]
+
+    def init(self):
+        # Seed the totals on install; afterwards the nightly cron keeps them exact
+        self.env.cr.execute(f"SELECT 1 FROM {self._table} LIMIT 1")
+        if not self.env.cr.fetchone():
+            self.rebuild_stats()
+
+    @api.model
+    def apply_deltas(self, deltas):
+        """Add {category id: [count, sum, sum of squares]} to the running totals.
+
+        Rows are upserted in category id order, so concurrent transactions
+        touching the same categories lock them in the same order and cannot
+        deadlock each other.
+        """
+        for category_id in sorted(deltas):
+            count, amount_sum, amount_sq_sum = deltas[category_id]
+            if not (count or amount_sum or amount_sq_sum):
+                continue
+            self.env.cr.execute(f"""
+                INSERT INTO {self._table} (category_id, transaction_count, amount_sum, amount_sq_sum)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (category_id) DO UPDATE SET
+                    transaction_count = {self._table}.transaction_count + EXCLUDED.transaction_count,
+                    amount_sum = {self._table}.amount_sum + EXCLUDED.amount_sum,
+                    amount_sq_sum = {self._table}.amount_sq_sum + EXCLUDED.amount_sq_sum
+            """, [category_id, count, amount_sum, amount_sq_sum])
+        self.invalidate_model()
+
+    @api.model
+    def rebuild_stats(self):
+        """Recompute every category's totals exactly in one GROUP BY (nightly cron)"""
+        self.env['bank.transaction'].flush_model(['category_id', 'amount'])
+        self.env.cr.execute(f"DELETE FROM {self._table}")
+        self.env.cr.execute(f"""
+            INSERT INTO {self._table} (category_id, transaction_count, amount_sum, amount_sq_sum)
+            SELECT category_id, COUNT(*), SUM(ABS(amount)), SUM(amount * amount)
+              FROM bank_transaction
+             WHERE category_id IS NOT NULL
+             GROUP BY category_id
+        """)
+        self.invalidate_model()
+        _logger.info(f"Rebuilt transaction statistics for {self.env.cr.rowcount} categories")
+
+    @api.model
+    def get_stats(self, categories):
+        """Return {category id: (count, sum, sum of squares)} for the given categories"""
+        stats = {category.id: (0, 0.0, 0.0) for category in categories}
+        if categories:
+            for row in self.search_read(
+                [('category_id', 'in', categories.ids)],
+                ['category_id', 'transaction_count', 'amount_sum', 'amount_sq_sum']
+            ):
+                stats[row['category_id'][0]] = (row['transaction_count'], row['amount_sum'], row['amount_sq_sum'])
+        return stats
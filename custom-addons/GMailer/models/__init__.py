@@ -1,3 +1,4 @@
 from . import google_credentials
 from . import email_statement
+from . import statement_pdf
 from . import bank_transaction
\ No newline at end of file
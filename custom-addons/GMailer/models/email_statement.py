@@ -1,17 +1,31 @@
 from odoo import models, fields, api
 from odoo.exceptions import UserError
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from concurrent.futures import ThreadPoolExecutor
+from .google_credentials import get_gmail_service
+from .pdf_extraction import BoundedLog, parse_statement_pdf, parse_statement_text
+from .statement_parsers import registry_version
 import base64
+import hashlib
 from bs4 import BeautifulSoup
-import re
-from datetime import datetime
 import logging
-import io
 import pytz
 
 _logger = logging.getLogger(__name__)
 
+# Gmail searches used for a full (non-incremental) listing
+STATEMENT_QUERIES = [
+    'from:@tymebank.co.za subject:Statement',
+    'from:@capitecbank.co.za subject:Statement',
+]
+# Same filter applied client-side to messages reported by the history API
+STATEMENT_SENDER_DOMAINS = ('@tymebank.co.za', '@capitecbank.co.za')
+# Gmail accepts up to 100 calls per batch request but rate-limits above 50
+GMAIL_BATCH_SIZE = 50
+# Bulk PDF pipeline: statements handled together, and statements per download task
+PDF_PIPELINE_BATCH_SIZE = 50
+PDF_DOWNLOAD_CHUNK_SIZE = 10
+
 class EmailStatement(models.Model):
     _name = 'email.statement'
     _description = 'Email Bank Statement'
@@ -30,15 +44,22 @@ class EmailStatement(models.Model):
     body_text = fields.Text(string='Body Text')
     attachment_count = fields.Integer(string='Attachments', compute='_compute_attachment_count')
     transaction_ids = fields.One2many('bank.transaction', 'statement_id', string='Transaction Lines')
+    pdf_ids = fields.One2many('email.statement.pdf', 'statement_id', string='Cached PDFs')
     transaction_count = fields.Integer(string='Transaction Count', compute='_compute_transaction_count')
     state = fields.Selection([
         ('draft', 'Draft'),
         ('parsed', 'Parsed'),
         ('imported', 'Imported'),
+        ('error', 'Error'),
     ], default='draft', string='Status')
     has_pdf = fields.Boolean(string='Has PDF', default=False)
     pdf_password = fields.Char(string='PDF Password', help='Password to unlock PDF if protected')
     parsing_log = fields.Text(string='Parsing Log', readonly=True, help='Debug information from PDF parsing')
+    parse_error = fields.Char(string='Parse Error', readonly=True, help='Why the last download & parse failed')
+    
+    _sql_constraints = [
+        ('gmail_id_unique', 'UNIQUE(gmail_id)', 'This Gmail message has already been imported!')
+    ]
     
     @api.depends('sender')
     def _compute_bank_name(self):
@@ -75,202 +96,444 @@ class EmailStatement(models.Model):
         }
     
     def action_download_and_parse_pdf(self):
-        """Download PDF from Gmail and parse transactions"""
+        """Download PDFs from Gmail and parse transactions for the selected statements"""
+        # Get authenticated credentials
+        credentials = self.env['google.credentials'].search([
+            ('is_authenticated', '=', True)
+        ], limit=1)
+        
+        if not credentials:
+            raise UserError('No authenticated Google credentials found.')
+        
+        failures = self._download_and_parse_pdfs(credentials)
+        
+        if len(self) == 1:
+            if failures:
+                # Not a UserError: rolling back would drop the stored PDF and the recorded error
+                return {
+                    'type': 'ir.actions.client',
+                    'tag': 'display_notification',
+                    'params': {
+                        'title': 'Parsing Failed',
+                        'message': failures[self.id],
+                        'type': 'danger',
+                        'sticky': True,
+                    }
+                }
+            message = f'PDF parsed! Found {self.transaction_count} transactions.'
+        else:
+            parsed = self.filtered(lambda r: r.id not in failures)
+            message = (
+                f'Parsed {len(parsed)} of {len(self)} statements, '
+                f'found {sum(parsed.mapped("transaction_count"))} transactions.'
+            )
+            if failures:
+                message += f' {len(failures)} failed, see their Parse Error.'
+        
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Success' if not failures else 'Completed with errors',
+                'message': message,
+                'type': 'success' if not failures else 'warning',
+            }
+        }
+    
+    def _get_pdf_download_threads(self):
+        """Return the number of Gmail download threads from system parameters"""
+        threads = int(self.env['ir.config_parameter'].sudo().get_param('gmailer.pdf_download_threads', 4))
+        return max(threads, 1)
+    
+    def _download_and_parse_pdfs(self, credentials):
+        """Bulk download & parse engine.
+        
+        Statements are handled PDF_PIPELINE_BATCH_SIZE at a time: Gmail
+        downloads overlap in a thread pool, text extraction runs inline, then
+        the batch is written back. Everything stays in the caller's
+        transaction: the download threads never touch the cursor.
+        PDFs already in the email.statement.pdf cache are not downloaded
+        again, and statements whose PDFs, password and parser version are
+        unchanged keep their transactions.
+        Returns {statement id: error message} for the statements that failed.
+        """
+        threads = self._get_pdf_download_threads()
+        failures = {}
+        
+        for start in range(0, len(self), PDF_PIPELINE_BATCH_SIZE):
+            batch = self[start:start + PDF_PIPELINE_BATCH_SIZE]
+            to_download = batch.filtered(lambda r: not r._has_cached_pdfs())
+            if to_download:
+                downloads, batch_failures = to_download._download_pdfs_parallel(credentials, threads)
+            else:
+                downloads, batch_failures = {}, {}
+            plans = batch._plan_pdf_work(downloads, batch_failures)
+            extractions = batch._extract_pdfs(plans, batch_failures)
+            batch._write_parsed_pdfs(plans, extractions, batch_failures)
+            failures.update(batch_failures)
+        
+        return failures
+    
+    def _has_cached_pdfs(self):
+        """True when every PDF of this statement is already stored locally"""
+        self.ensure_one()
+        return bool(self.pdf_ids) and all(self.pdf_ids.mapped('attachment_id'))
+    
+    def _plan_pdf_work(self, downloads, failures):
+        """Work out, per statement, which PDFs need text extraction and whether to re-parse.
+        
+        Returns {statement id: plan} where plan holds the password
+        'fingerprint', an 'up_to_date' flag and one item per PDF with its
+        cache row, freshly downloaded bytes (if any), SHA-256 and the cached
+        'text' (None when the PDF has to be extracted again).
+        """
+        PdfCache = self.env['email.statement.pdf']
+        plans = {}
         for record in self:
-            # Delete existing transactions first
-            record.transaction_ids.unlink()
+            if record.id in failures:
+                continue
             
-            # Get authenticated credentials
-            credentials = self.env['google.credentials'].search([
-                ('is_authenticated', '=', True)
-            ], limit=1)
+            fingerprint = PdfCache._password_fingerprint(record.pdf_password)
+            if record.id in downloads:
+                cached = {pdf.gmail_part_id: pdf for pdf in record.pdf_ids}
+                sources = [
+                    (filename, part_id, attachment_id, pdf_data,
+                     hashlib.sha256(pdf_data).hexdigest(), cached.get(part_id, PdfCache))
+                    for filename, part_id, attachment_id, pdf_data in downloads[record.id]
+                ]
+            else:
+                sources = [
+                    (pdf.filename, pdf.gmail_part_id, pdf.gmail_attachment_id, None, pdf.sha256, pdf)
+                    for pdf in record.pdf_ids
+                ]
             
-            if not credentials:
-                raise UserError('No authenticated Google credentials found.')
+            items = []
+            for filename, part_id, attachment_id, pdf_data, sha256, cache in sources:
+                # Extracted text stays valid while the bytes and password are the same
+                reusable = bool(cache) and cache.sha256 == sha256 and cache.password_fingerprint == fingerprint
+                items.append({
+                    'filename': filename,
+                    'part_id': part_id,
+                    'attachment_id': attachment_id,
+                    'data': pdf_data,
+                    'sha256': sha256,
+                    'cache': cache,
+                    'text': (cache.extracted_text or '') if reusable else None,
+                    'current': reusable and cache.parser_version == registry_version(),
+                })
             
-            # Build Gmail service
-            creds = Credentials(
-                token=credentials.access_token,
-                refresh_token=credentials.refresh_token,
-                token_uri='https://oauth2.googleapis.com/token',
-                client_id=credentials.client_id,
-                client_secret=credentials.client_secret,
-            )
+            plans[record.id] = {
+                'fingerprint': fingerprint,
+                'items': items,
+                'up_to_date': record.state == 'parsed' and all(item['current'] for item in items),
+            }
+        return plans
+    
+    def _download_pdfs_parallel(self, credentials, threads):
+        """Download these statements' PDFs, one batched Gmail call per chunk, chunks in parallel"""
+        # Worker threads only get plain values: the ORM cursor is not thread-safe
+        cache_key = credentials._get_gmail_cache_key()
+        token_info = credentials._get_gmail_token_info()
+        gmail_ids = [{record.id: record.gmail_id for record in self[i:i + PDF_DOWNLOAD_CHUNK_SIZE]}
+                     for i in range(0, len(self), PDF_DOWNLOAD_CHUNK_SIZE)]
+        
+        downloads = {}
+        failures = {}
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            futures = {
+                executor.submit(self._download_pdf_chunk, cache_key, token_info, chunk): chunk
+                for chunk in gmail_ids
+            }
+            for future, chunk in futures.items():
+                try:
+                    chunk_downloads, chunk_failures = future.result()
+                except Exception as e:
+                    _logger.error(f"Error downloading PDF: {str(e)}", exc_info=True)
+                    chunk_downloads, chunk_failures = {}, dict.fromkeys(chunk, str(e))
+                downloads.update(chunk_downloads)
+                failures.update({
+                    record_id: f'Failed to download PDF: {error}'
+                    for record_id, error in chunk_failures.items()
+                })
+        
+        for record_id, pdfs in downloads.items():
+            if not pdfs:
+                failures[record_id] = 'No PDF attachment found in this email.'
+        
+        return downloads, failures
+    
+    def _download_pdf_chunk(self, cache_key, token_info, gmail_ids):
+        """Thread worker: fetch the PDFs of {statement id: gmail_id} with this thread's client"""
+        service = get_gmail_service(cache_key, token_info)
+        return self._download_pdf_attachments(service, gmail_ids)
+    
+    def _extract_pdfs(self, plans, failures):
+        """Extract and match PDF transactions.
+        
+        PDFs with reusable cached text are only matched again; the others are
+        extracted from the downloaded bytes or from the stored file.
+        Extraction is pure Python and holds the GIL, so a thread pool would
+        not speed it up, and forking a server worker that holds database
+        sockets is unsafe: it runs inline.
+        Returns {(statement id, index): extraction}.
+        """
+        jobs = []
+        for record in self:
+            plan = plans.get(record.id)
+            if not plan or record.id in failures or plan['up_to_date']:
+                continue
+            for index, item in enumerate(plan['items']):
+                key = (record.id, index)
+                if item['text'] is not None:
+                    jobs.append((key, parse_statement_text, (item['text'], record.bank_name)))
+                else:
+                    pdf_source = item['data'] or self._get_pdf_source(item['cache'].attachment_id)
+                    jobs.append((key, parse_statement_pdf, (pdf_source, record.pdf_password, record.bank_name)))
+        
+        extractions = {}
+        for key, func, args in jobs:
+            try:
+                extractions[key] = func(*args)
+            except Exception as e:
+                _logger.error(f"Parse error: {str(e)}", exc_info=True)
+                failures[key[0]] = f'Parse failed: {str(e)}'
+        
+        return extractions
+    
+    def _get_pdf_source(self, attachment):
+        """Path of a stored PDF in the filestore, or its bytes when kept in the database"""
+        if attachment.store_fname:
+            return attachment._full_path(attachment.store_fname)
+        return attachment.raw
+    
+    def _store_statement_pdfs(self, plan, extractions):
+        """Save downloaded PDFs and freshly extracted text in the cache"""
+        self.ensure_one()
+        PdfCache = self.env['email.statement.pdf']
+        if any(item['data'] is not None for item in plan['items']):
+            # Drop parts that are no longer in the message
+            part_ids = {item['part_id'] for item in plan['items']}
+            self.pdf_ids.filtered(lambda pdf: pdf.gmail_part_id not in part_ids).unlink()
+        
+        for index, item in enumerate(plan['items']):
+            cache = item['cache']
+            if item['data'] is not None:
+                if not cache:
+                    cache = item['cache'] = PdfCache.create({
+                        'statement_id': self.id,
+                        'gmail_part_id': item['part_id'],
+                    })
+                vals = {
+                    'filename': item['filename'],
+                    'gmail_attachment_id': item['attachment_id'],
+                }
+                if not cache.attachment_id or cache.sha256 != item['sha256']:
+                    # Store the raw bytes, the filestore takes care of deduplication
+                    old_attachment = cache.attachment_id
+                    vals.update({
+                        'attachment_id': self.env['ir.attachment'].create({
+                            'name': item['filename'],
+                            'raw': item['data'],
+                            'res_model': self._name,
+                            'res_id': self.id,
+                            'mimetype': 'application/pdf',
+                        }).id,
+                        'sha256': item['sha256'],
+                        'extracted_text': False,
+                        'password_fingerprint': False,
+                    })
+                    cache.write(vals)
+                    old_attachment.unlink()
+                    _logger.info(f"Saved PDF: {item['filename']}")
+                else:
+                    cache.write(vals)
             
-            service = build('gmail', 'v1', credentials=creds)
+            extraction = extractions.get((self.id, index))
+            # Text of very large statements is not cached, they are extracted again
+            if extraction and not extraction['error'] and extraction['text'] is not None:
+                cache.write({
+                    'extracted_text': extraction['text'],
+                    'password_fingerprint': plan['fingerprint'],
+                })
+    
+    def _write_parsed_pdfs(self, plans, extractions, failures):
+        """Store attachments and transactions, recording a status per statement"""
+        for record in self:
+            plan = plans.get(record.id)
+            if plan:
+                # Outside the parse savepoint: a failed parse must not cost another download
+                record._store_statement_pdfs(plan, extractions)
             
-            try:
-                # Get the full message with attachments
-                msg_data = service.users().messages().get(
-                    userId='me', 
-                    id=record.gmail_id
-                ).execute()
-                
-                # Find PDF attachments
-                pdf_found = False
-                
-                if 'parts' in msg_data['payload']:
-                    for part in msg_data['payload']['parts']:
-                        filename = part.get('filename', '')
+            if record.id not in failures:
+                if plan['up_to_date']:
+                    _logger.info(f"Statement {record.id} unchanged since last parse, keeping its transactions")
+                    continue
+                try:
+                    # Savepoint: a failing statement must not undo the rest of the batch
+                    with self.env.cr.savepoint():
+                        # Delete existing transactions first
+                        record.transaction_ids.unlink()
                         
-                        # Check if it's a PDF
-                        if filename.lower().endswith('.pdf'):
-                            pdf_found = True
-                            _logger.info(f"Found PDF attachment: {filename}")
-                            
-                            # Get attachment data
-                            if 'body' in part and 'attachmentId' in part['body']:
-                                att_id = part['body']['attachmentId']
-                                attachment = service.users().messages().attachments().get(
-                                    userId='me',
-                                    messageId=record.gmail_id,
-                                    id=att_id
-                                ).execute()
-                                
-                                # Decode the PDF data
-                                pdf_data = base64.urlsafe_b64decode(
-                                    attachment['data'].encode('UTF-8')
-                                )
-                                
-                                # Save as Odoo attachment
-                                self.env['ir.attachment'].create({
-                                    'name': filename,
-                                    'datas': base64.b64encode(pdf_data),
-                                    'res_model': self._name,
-                                    'res_id': record.id,
-                                    'mimetype': 'application/pdf',
-                                })
-                                
-                                _logger.info(f"Saved PDF: {filename}")
-                                
-                                # Parse PDF and extract transactions
-                                record._parse_pdf_transactions(pdf_data)
-                
-                if pdf_found:
-                    record.has_pdf = True
-                    record.state = 'parsed'
-                    
-                    return {
-                        'type': 'ir.actions.client',
-                        'tag': 'display_notification',
-                        'params': {
-                            'title': 'Success',
-                            'message': f'PDF parsed! Found {record.transaction_count} transactions.',
-                            'type': 'success',
-                        }
-                    }
-                else:
-                    raise UserError('No PDF attachment found in this email.')
-                    
-            except Exception as e:
-                _logger.error(f"Error downloading PDF: {str(e)}", exc_info=True)
-                raise UserError(f'Failed to download PDF: {str(e)}')
+                        for index, item in enumerate(plan['items']):
+                            # Create the transactions matched by the worker
+                            record._parse_pdf_transactions(item['data'], extractions[(record.id, index)])
+                            item['cache'].parser_version = registry_version()
+                        
+                        record.write({'has_pdf': True, 'state': 'parsed', 'parse_error': False})
+                except UserError as e:
+                    failures[record.id] = str(e.args[0])
+                except Exception as e:
+                    _logger.error(f"Error parsing PDF for statement {record.id}: {str(e)}", exc_info=True)
+                    failures[record.id] = f'Parse failed: {str(e)}'
+            
+            if record.id in failures:
+                record.write({'state': 'error', 'parse_error': failures[record.id]})
+    
+    def _gmail_batch_execute(self, service, keyed_requests):
+        """Execute (key, request) pairs through Gmail batch HTTP calls.
+        
+        Returns (results, errors), both dicts keyed by the given keys, so a
+        failing item never hides the responses of the rest of its batch.
+        """
+        results = {}
+        errors = {}
+        keys = {}
+        
+        def _callback(request_id, response, exception):
+            key = keys[request_id]
+            if exception is not None:
+                errors[key] = exception
+            else:
+                results[key] = response
+        
+        for start in range(0, len(keyed_requests), GMAIL_BATCH_SIZE):
+            batch = service.new_batch_http_request(callback=_callback)
+            for index, (key, request) in enumerate(keyed_requests[start:start + GMAIL_BATCH_SIZE], start):
+                keys[str(index)] = key
+                batch.add(request, request_id=str(index))
+            batch.execute()
+        
+        for key, error in errors.items():
+            _logger.warning(f"Gmail batch item {key} failed: {error}")
+        
+        return results, errors
+    
+    def _batch_get_messages(self, service, message_ids, **get_kwargs):
+        """Fetch many messages in batched calls; returns (messages, errors) keyed by message ID"""
+        messages_api = service.users().messages()
+        return self._gmail_batch_execute(service, [
+            (message_id, messages_api.get(userId='me', id=message_id, **get_kwargs))
+            for message_id in message_ids
+        ])
     
-    def _parse_pdf_transactions(self, pdf_data):
-        """Parse PDF and extract transaction data - FIXED VERSION"""
-        parsing_log = []
+    def _batch_get_attachments(self, service, attachment_refs):
+        """Fetch (message_id, attachment_id) pairs in batched calls; returns (attachments, errors)"""
+        attachments_api = service.users().messages().attachments()
+        return self._gmail_batch_execute(service, [
+            ((message_id, attachment_id), attachments_api.get(
+                userId='me', messageId=message_id, id=attachment_id
+            ))
+            for message_id, attachment_id in attachment_refs
+        ])
+    
+    def _get_pdf_parts(self, msg_data):
+        """Return [(filename, part_id, attachment_id)] for the PDF parts of a message"""
+        pdf_parts = []
+        for part in msg_data['payload'].get('parts', []):
+            filename = part.get('filename', '')
+            if filename.lower().endswith('.pdf') and 'attachmentId' in part.get('body', {}):
+                _logger.info(f"Found PDF attachment: {filename}")
+                pdf_parts.append((filename, part.get('partId') or filename, part['body']['attachmentId']))
+        return pdf_parts
+    
+    def _download_pdf_attachments(self, service, gmail_ids):
+        """Download the PDF attachments of {statement id: gmail_id} in batched calls.
+        
+        Works on plain values only, so it is safe to call from worker threads.
+        Returns (downloads, failures): downloads maps statement id to a list
+        of (filename, part_id, attachment_id, pdf_bytes); failures maps
+        statement id to an error text.
+        """
+        messages, message_errors = self._batch_get_messages(
+            service, list(set(gmail_ids.values()))
+        )
+        
+        failures = {}
+        parts_by_record = {}
+        for record_id, gmail_id in gmail_ids.items():
+            if gmail_id in message_errors:
+                failures[record_id] = str(message_errors[gmail_id])
+                continue
+            parts_by_record[record_id] = [
+                (filename, part_id, gmail_id, attachment_id)
+                for filename, part_id, attachment_id in self._get_pdf_parts(messages[gmail_id])
+            ]
+        
+        attachments, attachment_errors = self._batch_get_attachments(service, list({
+            (message_id, attachment_id)
+            for parts in parts_by_record.values()
+            for filename, part_id, message_id, attachment_id in parts
+        }))
+        
+        downloads = {}
+        for record_id, parts in parts_by_record.items():
+            pdfs = []
+            for filename, part_id, message_id, attachment_id in parts:
+                ref = (message_id, attachment_id)
+                if ref in attachment_errors:
+                    failures[record_id] = f"{filename}: {attachment_errors[ref]}"
+                    break
+                # Decode the PDF data
+                pdfs.append((filename, part_id, attachment_id, base64.urlsafe_b64decode(
+                    attachments[ref]['data'].encode('UTF-8')
+                )))
+            else:
+                downloads[record_id] = pdfs
+        
+        return downloads, failures
+    
+    def _parse_pdf_transactions(self, pdf_data, extraction=None):
+        """Parse PDF and extract transaction data - FIXED VERSION
+        
+        extraction is the result of parse_statement_pdf when the PDF was
+        already parsed elsewhere (e.g. by the bulk pipeline).
+        """
+        parsing_log = BoundedLog()
         parsing_log.append("=== PDF PARSING DEBUG LOG ===\n")
         
         try:
-            # Try PyPDF2
-            try:
-                import PyPDF2
-                pdf_file = io.BytesIO(pdf_data)
-                pdf_reader = PyPDF2.PdfReader(pdf_file)
-                
-                parsing_log.append(f"Using PyPDF2, found {len(pdf_reader.pages)} pages\n")
-                
-                if pdf_reader.is_encrypted:
-                    parsing_log.append("PDF is password protected\n")
-                    if not self.pdf_password:
-                        self.parsing_log = ''.join(parsing_log)
-                        raise UserError('This PDF is password protected. Please enter the password and try again.')
-                    
-                    decrypt_result = pdf_reader.decrypt(self.pdf_password)
-                    if decrypt_result == 0:
-                        self.parsing_log = ''.join(parsing_log)
-                        raise UserError('Incorrect PDF password.')
-                    parsing_log.append("PDF decrypted successfully\n")
-                
-                text = ""
-                for i, page in enumerate(pdf_reader.pages):
-                    page_text = page.extract_text()
-                    text += page_text
-                    parsing_log.append(f"\n--- Page {i+1} (first 300 chars) ---\n{page_text[:300]}...\n")
-                    
-            except ImportError:
-                parsing_log.append("PyPDF2 not available, trying pdfplumber\n")
-                import pdfplumber
-                pdf_file = io.BytesIO(pdf_data)
-                
-                with pdfplumber.open(pdf_file, password=self.pdf_password if self.pdf_password else None) as pdf:
-                    text = ""
-                    for i, page in enumerate(pdf.pages):
-                        page_text = page.extract_text()
-                        text += page_text
-                        parsing_log.append(f"\n--- Page {i+1} (first 300 chars) ---\n{page_text[:300]}...\n")
-            
-            parsing_log.append(f"\n=== FULL TEXT LENGTH: {len(text)} characters ===\n")
+            if extraction is None:
+                extraction = parse_statement_pdf(pdf_data, self.pdf_password, self.bank_name)
             parsing_log.append(f"Bank type: {self.bank_name}\n")
+            parsing_log.extend(extraction['log'])
             
-            # Parse transactions
-            if self.bank_name == 'tymebank':
-                transactions = self._parse_tymebank_pdf(text, parsing_log)
-            elif self.bank_name == 'capitec':
-                transactions = self._parse_capitec_pdf(text, parsing_log)
-            else:
-                transactions = self._parse_generic_pdf(text, parsing_log)
+            if extraction['error'] == 'password_required':
+                self.parsing_log = parsing_log.text()
+                raise UserError('This PDF is password protected. Please enter the password and try again.')
+            if extraction['error'] == 'bad_password':
+                self.parsing_log = parsing_log.text()
+                raise UserError('Incorrect PDF password.')
+            
+            transactions = extraction['transactions']
             
             parsing_log.append(f"\n=== FOUND {len(transactions)} TRANSACTIONS ===\n")
             
-            # Create transactions with detailed error handling
-            created_count = 0
+            # Validate every row first, then create them all in one call so the
+            # stored computes (here and in dependent modules) run once per batch
+            vals_list = []
             failed_count = 0
-            created_ids = []
-            
             for idx, trans in enumerate(transactions, 1):
                 try:
-                    parsing_log.append(f"\n--- Transaction {idx} ---\n")
-                    parsing_log.append(f"Date: {trans.get('date')}\n")
-                    parsing_log.append(f"Description: {trans.get('description', '')[:50]}...\n")
-                    parsing_log.append(f"Amount: {trans.get('amount')}\n")
-                    parsing_log.append(f"Type: {trans.get('type')}\n")
-                    
-                    # Validate
-                    if not trans.get('date'):
-                        parsing_log.append("ERROR: Missing date\n")
-                        failed_count += 1
-                        continue
-                    
-                    if not trans.get('description'):
-                        parsing_log.append("ERROR: Missing description\n")
-                        failed_count += 1
-                        continue
-                    
-                    if trans.get('amount') is None:
-                        parsing_log.append("ERROR: Missing amount\n")
-                        failed_count += 1
-                        continue
-                    
-                    # Create the transaction - FIXED: No manual commit
-                    new_trans = self.env['bank.transaction'].create({
-                        'statement_id': self.id,
-                        'date': trans['date'],
-                        'description': str(trans['description'])[:500],
-                        'amount': abs(float(trans['amount'])),
-                        'transaction_type': trans.get('type', 'debit'),
-                        'reference': str(trans.get('reference', ''))[:100],
-                    })
-                    
-                    parsing_log.append(f"✓ Created transaction ID: {new_trans.id}\n")
-                    created_ids.append(new_trans.id)
-                    created_count += 1
-                    
-                except Exception as e:
-                    parsing_log.append(f"✗ ERROR: {str(e)}\n")
-                    _logger.error(f"Failed to create transaction: {str(e)}", exc_info=True)
+                    vals_list.append(self._prepare_transaction_vals(trans))
+                except (KeyError, TypeError, ValueError) as e:
+                    parsing_log.append(f"✗ Transaction {idx} ({trans.get('date')}, {trans.get('amount')}): {str(e)}\n")
                     failed_count += 1
             
+            new_transactions = self._create_transactions(vals_list, parsing_log)
+            failed_count += len(vals_list) - len(new_transactions)
+            created_ids = new_transactions.ids
+            created_count = len(created_ids)
+            
             parsing_log.append(f"\n=== SUMMARY ===\n")
             parsing_log.append(f"Created: {created_count}\n")
             parsing_log.append(f"Failed: {failed_count}\n")
@@ -278,7 +541,7 @@ class EmailStatement(models.Model):
             parsing_log.append(f"Created IDs: {created_ids}\n")
             
             # Save log
-            self.parsing_log = ''.join(parsing_log)
+            self.parsing_log = parsing_log.text()
             
             _logger.info(f"Created {created_count} transactions: {created_ids}, {failed_count} failed")
             
@@ -286,133 +549,158 @@ class EmailStatement(models.Model):
                 raise UserError(f'No transactions created. Found {len(transactions)} in PDF. Check Parsing Log.')
             
         except UserError:
-            self.parsing_log = ''.join(parsing_log)
+            self.parsing_log = parsing_log.text()
             raise
         except Exception as e:
             parsing_log.append(f"\n=== FATAL ERROR ===\n{str(e)}\n")
             import traceback
             parsing_log.append(f"\n{traceback.format_exc()}\n")
-            self.parsing_log = ''.join(parsing_log)
+            self.parsing_log = parsing_log.text()
             _logger.error(f"Parse error: {str(e)}", exc_info=True)
             raise UserError(f'Parse failed: {str(e)}')
     
-    def _parse_tymebank_pdf(self, text, log):
-        """Parse TymeBank PDF"""
-        transactions = []
-        log.append("\n=== TYMEBANK PATTERNS ===\n")
-        
-        patterns = [
-            (r'(\d{2}\s+\w{3}\s+\d{4})\s+([^\t\n]+?)\s+(-?R[\d,]+\.\d{2})', '%d %b %Y'),
-            (r'(\d{4}-\d{2}-\d{2})\s+([^\t\n]+?)\s+(-?R?[\d,]+\.\d{2})', '%Y-%m-%d'),
-            (r'(\d{2}/\d{2}/\d{4})\s+([^\t\n]+?)\s+(-?R?[\d,]+\.\d{2})', '%d/%m/%Y'),
-        ]
+    def _prepare_transaction_vals(self, trans):
+        """Validate a parsed row and return its bank.transaction values"""
+        if not trans.get('date'):
+            raise ValueError('Missing date')
+        if not trans.get('description'):
+            raise ValueError('Missing description')
+        if trans.get('amount') is None:
+            raise ValueError('Missing amount')
         
-        for idx, (pattern, date_fmt) in enumerate(patterns, 1):
-            log.append(f"\nPattern {idx}: {pattern}\n")
-            matches = re.findall(pattern, text, re.MULTILINE)
-            log.append(f"Matches: {len(matches)}\n")
-            
-            if matches:
-                for match in matches:
-                    try:
-                        trans_date = datetime.strptime(match[0], date_fmt).date()
-                        description = match[1].strip()
-                        amount = float(match[2].replace('R', '').replace(',', ''))
-                        
-                        transactions.append({
-                            'date': trans_date,
-                            'description': description,
-                            'amount': abs(amount),
-                            'type': 'debit' if amount < 0 else 'credit',
-                            'reference': f"TYME-{trans_date.strftime('%Y%m%d')}"
-                        })
-                        log.append(f"✓ {trans_date} | {description[:20]} | {amount}\n")
-                    except Exception as e:
-                        log.append(f"✗ Error: {str(e)}\n")
-                        continue
-                
-                if transactions:
-                    break
-        
-        return transactions
+        return {
+            'statement_id': self.id,
+            'date': trans['date'],
+            'description': str(trans['description'])[:500],
+            'amount': abs(float(trans['amount'])),
+            'transaction_type': trans.get('type', 'debit'),
+            'reference': str(trans.get('reference', ''))[:100],
+        }
     
-    def _parse_capitec_pdf(self, text, log):
-        """Parse Capitec PDF"""
-        transactions = []
-        log.append("\n=== CAPITEC PATTERNS ===\n")
-        
-        patterns = [
-            (r'(\d{4}/\d{2}/\d{2})\s+([^\t\n]+?)\s+(-?[\d,]+\.\d{2})', '%Y/%m/%d'),
-            (r'(\d{2}/\d{2}/\d{4})\s+([^\t\n]+?)\s+(-?R?[\d,]+\.\d{2})', '%d/%m/%Y'),
-        ]
+    def _create_transactions(self, vals_list, parsing_log):
+        """Create validated rows in one batch, falling back to row by row if the batch fails"""
+        BankTransaction = self.env['bank.transaction']
+        if not vals_list:
+            return BankTransaction
         
-        for idx, (pattern, date_fmt) in enumerate(patterns, 1):
-            log.append(f"\nPattern {idx}\n")
-            matches = re.findall(pattern, text, re.MULTILINE)
-            log.append(f"Matches: {len(matches)}\n")
-            
-            if matches:
-                for match in matches:
-                    try:
-                        trans_date = datetime.strptime(match[0], date_fmt).date()
-                        description = match[1].strip()
-                        amount = float(match[2].replace('R', '').replace(',', ''))
-                        
-                        transactions.append({
-                            'date': trans_date,
-                            'description': description,
-                            'amount': abs(amount),
-                            'type': 'debit' if amount < 0 else 'credit',
-                            'reference': f"CAP-{trans_date.strftime('%Y%m%d')}"
-                        })
-                    except Exception as e:
-                        log.append(f"✗ Error: {str(e)}\n")
-                        continue
-                
-                if transactions:
-                    break
+        try:
+            with self.env.cr.savepoint():
+                return BankTransaction.create(vals_list)
+        except Exception as e:
+            _logger.warning(f"Batch create failed for statement {self.id}, retrying row by row: {str(e)}")
         
-        return transactions
+        created = BankTransaction
+        for idx, vals in enumerate(vals_list, 1):
+            try:
+                with self.env.cr.savepoint():
+                    created |= BankTransaction.create(vals)
+            except Exception as e:
+                parsing_log.append(f"✗ ERROR creating row {idx}: {str(e)}\n")
+                _logger.error(f"Failed to create transaction: {str(e)}", exc_info=True)
+        return created
+    
+    def _list_query_message_ids(self, service):
+        """List every statement message matching STATEMENT_QUERIES, following pagination"""
+        message_ids = []
+        for query in STATEMENT_QUERIES:
+            page_token = None
+            while True:
+                results = service.users().messages().list(
+                    userId='me', q=query, maxResults=500, pageToken=page_token
+                ).execute()
+                message_ids.extend(msg['id'] for msg in results.get('messages', []))
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+        return list(dict.fromkeys(message_ids))
+    
+    def _list_history_message_ids(self, service, start_history_id):
+        """List IDs of messages added to the mailbox since start_history_id"""
+        message_ids = []
+        page_token = None
+        while True:
+            results = service.users().history().list(
+                userId='me',
+                startHistoryId=start_history_id,
+                historyTypes=['messageAdded'],
+                pageToken=page_token,
+            ).execute()
+            for history in results.get('history', []):
+                for added in history.get('messagesAdded', []):
+                    message_ids.append(added['message']['id'])
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+        return list(dict.fromkeys(message_ids))
     
-    def _parse_generic_pdf(self, text, log):
-        """Generic PDF parsing"""
-        transactions = []
-        log.append("\n=== GENERIC PATTERNS ===\n")
-        
-        patterns = [
-            (r'(\d{2}/\d{2}/\d{4})\s+([^\d\-\+\$R]+)\s+(-?R?[\d,]+\.\d{2})', '%d/%m/%Y'),
-            (r'(\d{4}-\d{2}-\d{2})\s+([^\d\-\+\$R]+)\s+(-?R?[\d,]+\.\d{2})', '%Y-%m-%d'),
+    @api.model
+    def _filter_new_gmail_ids(self, message_ids):
+        """Drop message IDs that are already imported, using a single query"""
+        if not message_ids:
+            return []
+        existing = {
+            row['gmail_id'] for row in self.search_read(
+                [('gmail_id', 'in', list(message_ids))], ['gmail_id']
+            )
+        }
+        return [message_id for message_id in message_ids if message_id not in existing]
+    
+    def _is_statement_message(self, msg_data):
+        """Check From/Subject headers against the statement search criteria"""
+        headers = msg_data.get('payload', {}).get('headers', [])
+        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '')
+        sender = next((h['value'] for h in headers if h['name'] == 'From'), '')
+        return (
+            'statement' in subject.lower()
+            and any(domain in sender.lower() for domain in STATEMENT_SENDER_DOMAINS)
+        )
+    
+    def _filter_statement_message_ids(self, service, message_ids):
+        """Keep only the new messages that look like bank statements"""
+        messages, errors = self._batch_get_messages(
+            service, message_ids, format='metadata', metadataHeaders=['From', 'Subject']
+        )
+        for error in errors.values():
+            # Messages deleted since they arrived show up in history but are gone
+            if not (isinstance(error, HttpError) and error.resp.status == 404):
+                raise error
+        return [
+            message_id for message_id in message_ids
+            if message_id in messages and self._is_statement_message(messages[message_id])
         ]
+    
+    def _list_statement_message_ids(self, service, credentials, full_sync=False):
+        """Return (message_ids, history_id) to import for these credentials.
         
-        for pattern, date_fmt in patterns:
-            matches = re.findall(pattern, text, re.MULTILINE)
-            log.append(f"Matches: {len(matches)}\n")
-            
-            if matches:
-                for match in matches:
-                    try:
-                        trans_date = datetime.strptime(match[0], date_fmt).date()
-                        description = match[1].strip()
-                        amount = float(match[2].replace('R', '').replace(',', ''))
-                        
-                        transactions.append({
-                            'date': trans_date,
-                            'description': description,
-                            'amount': abs(amount),
-                            'type': 'debit' if amount < 0 else 'credit',
-                            'reference': f"GEN-{trans_date.strftime('%Y%m%d')}"
-                        })
-                    except:
-                        continue
-                
-                if transactions:
-                    break
+        Uses the Gmail history API when a previous historyId is stored, and
+        falls back to a full paginated search when it is missing or expired.
+        """
+        # Capture the mailbox position before listing so nothing slips between runs
+        history_id = service.users().getProfile(userId='me').execute().get('historyId')
         
-        return transactions
+        if credentials.history_id and not full_sync:
+            try:
+                added_ids = self._list_history_message_ids(service, credentials.history_id)
+            except HttpError as e:
+                # 404 means the stored historyId is too old; anything else is a real error
+                if e.resp.status != 404:
+                    raise
+                _logger.info(f"Gmail history {credentials.history_id} expired, running full sync")
+            else:
+                _logger.info(f"Gmail history: {len(added_ids)} new message(s) since {credentials.history_id}")
+                # No need to fetch metadata for messages we already have
+                added_ids = self._filter_new_gmail_ids(added_ids)
+                return self._filter_statement_message_ids(service, added_ids), history_id
+        
+        return self._list_query_message_ids(service), history_id
     
     @api.model
-    def fetch_statements_from_gmail(self, credential_id=None):
-        """Fetch statements from Gmail"""
+    def fetch_statements_from_gmail(self, credential_id=None, full_sync=False):
+        """Fetch statements from Gmail.
+        
+        Incremental by default: only messages added since the last stored
+        historyId are considered. Pass full_sync=True to re-list the mailbox.
+        """
         
         if not credential_id:
             credentials = self.env['google.credentials'].search([('is_authenticated', '=', True)], limit=1)
@@ -423,55 +711,53 @@ class EmailStatement(models.Model):
             raise UserError('No authenticated Google credentials found.')
         
         try:
-            creds = Credentials(
-                token=credentials.access_token,
-                refresh_token=credentials.refresh_token,
-                token_uri='https://oauth2.googleapis.com/token',
-                client_id=credentials.client_id,
-                client_secret=credentials.client_secret,
-            )
-            
-            service = build('gmail', 'v1', credentials=creds)
+            service = credentials._get_gmail_service()
+        except UserError:
+            raise
         except Exception as e:
             _logger.error(f"Gmail service failed: {str(e)}")
             raise UserError(f'Failed to connect: {str(e)}')
         
-        queries = [
-            'from:@tymebank.co.za subject:Statement',
-            'from:@capitecbank.co.za subject:Statement',
-        ]
-        
-        all_messages = []
-        for query in queries:
-            try:
-                results = service.users().messages().list(userId='me', q=query, maxResults=50).execute()
-                messages = results.get('messages', [])
-                all_messages.extend(messages)
-            except Exception as e:
-                _logger.error(f"Search error: {str(e)}")
-                continue
+        try:
+            message_ids, history_id = self._list_statement_message_ids(
+                service, credentials, full_sync=full_sync
+            )
+        except Exception as e:
+            _logger.error(f"Search error: {str(e)}")
+            raise UserError(f'Failed to list Gmail messages: {str(e)}')
         
-        if not all_messages:
+        if not message_ids:
+            credentials.history_id = history_id
             return {
                 'type': 'ir.actions.client',
                 'tag': 'display_notification',
                 'params': {
                     'title': 'No Statements Found',
-                    'message': 'No bank statement emails found.',
+                    'message': 'No new bank statement emails found.',
                     'type': 'warning',
                 }
             }
         
+        # Resolve the whole listing against known gmail_ids before downloading anything
+        new_message_ids = self._filter_new_gmail_ids(message_ids)
+        skipped_count = len(message_ids) - len(new_message_ids)
+        message_ids = new_message_ids
+        
+        try:
+            # Per-message failures come back in errors instead of aborting the run
+            messages, errors = self._batch_get_messages(service, message_ids, format='full')
+        except Exception as e:
+            _logger.error(f"Download error: {str(e)}")
+            raise UserError(f'Failed to download Gmail messages: {str(e)}')
+        
         imported_count = 0
-        skipped_count = 0
+        failed_count = len(errors)
         
-        for msg in all_messages:
+        for message_id in message_ids:
+            if message_id not in messages:
+                continue
             try:
-                msg_data = service.users().messages().get(userId='me', id=msg['id'], format='full').execute()
-                
-                if self.search([('gmail_id', '=', msg['id'])]):
-                    skipped_count += 1
-                    continue
+                msg_data = messages[message_id]
                 
                 headers = msg_data['payload']['headers']
                 subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
@@ -504,24 +790,34 @@ class EmailStatement(models.Model):
                     except:
                         pass
                 
-                statement = self.create({
-                    'name': subject,
-                    'gmail_id': msg['id'],
-                    'date': msg_date,
-                    'sender': sender,
-                    'body_html': body_html,
-                    'body_text': body_text,
-                })
+                # Savepoint so a concurrent import hitting gmail_id_unique only loses this row
+                with self.env.cr.savepoint():
+                    statement = self.create({
+                        'name': subject,
+                        'gmail_id': message_id,
+                        'date': msg_date,
+                        'sender': sender,
+                        'body_html': body_html,
+                        'body_text': body_text,
+                    })
                 
                 imported_count += 1
                 
             except Exception as e:
                 _logger.error(f"Import error: {str(e)}")
+                failed_count += 1
                 continue
         
+        # Only advance the history pointer when every message made it in,
+        # otherwise the failed ones would never be offered again
+        if not failed_count:
+            credentials.history_id = history_id
+        
         message = f"Imported {imported_count} statement(s)"
         if skipped_count > 0:
             message += f" ({skipped_count} already existed)"
+        if failed_count > 0:
+            message += f", {failed_count} failed"
         
         return {
             'type': 'ir.actions.client',
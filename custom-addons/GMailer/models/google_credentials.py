@@ -1,6 +1,77 @@
 from odoo import models, fields, api
 from odoo.exceptions import UserError
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from datetime import timedelta
 import json
+import logging
+import requests
+import threading
+
+_logger = logging.getLogger(__name__)
+
+TOKEN_URI = 'https://oauth2.googleapis.com/token'
+DISCOVERY_URL = 'https://gmail.googleapis.com/$discovery/rest?version=v1'
+# Refresh access tokens this long before Google expires them
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+# Discovery document, loaded once per process
+_discovery_doc = None
+_discovery_lock = threading.Lock()
+# Gmail clients per thread: httplib2 connections must not be shared across threads
+_service_cache = threading.local()
+
+
+def _get_discovery_doc():
+    """Return the Gmail discovery document, reading it only once per process"""
+    global _discovery_doc
+    if _discovery_doc is None:
+        with _discovery_lock:
+            if _discovery_doc is None:
+                # Prefer the copy shipped with googleapiclient, fall back to the network
+                doc = get_static_doc('gmail', 'v1')
+                if doc is None:
+                    response = requests.get(DISCOVERY_URL, timeout=30)
+                    response.raise_for_status()
+                    doc = response.text
+                _discovery_doc = doc
+    return _discovery_doc
+
+
+def get_gmail_service(cache_key, token_info):
+    """Return this thread's Gmail client for cache_key, building it on first use.
+    
+    token_info holds plain values (see GoogleCredentials._get_gmail_token_info)
+    so this can be called from worker threads that have no environment.
+    """
+    services = getattr(_service_cache, 'services', None)
+    if services is None:
+        services = _service_cache.services = {}
+    
+    cached = services.get(cache_key)
+    if cached:
+        creds, service = cached
+        if (creds.refresh_token, creds.client_id) == (token_info['refresh_token'], token_info['client_id']):
+            # Same grant: swap in the current access token without rebuilding the client
+            creds.token = token_info['token']
+            creds.expiry = token_info['expiry']
+            return service
+    
+    creds = Credentials(
+        token=token_info['token'],
+        refresh_token=token_info['refresh_token'],
+        token_uri=TOKEN_URI,
+        client_id=token_info['client_id'],
+        client_secret=token_info['client_secret'],
+    )
+    creds.expiry = token_info['expiry']
+    service = build_from_document(_get_discovery_doc(), credentials=creds)
+    services[cache_key] = (creds, service)
+    return service
+
 
 class GoogleCredentials(models.Model):
     _name = 'google.credentials'
@@ -14,6 +85,12 @@ class GoogleCredentials(models.Model):
     refresh_token = fields.Text(string='Refresh Token')
     token_expiry = fields.Datetime(string='Token Expiry')
     is_authenticated = fields.Boolean(string='Authenticated', compute='_compute_is_authenticated', store=True)
+    history_id = fields.Char(
+        string='Gmail History ID',
+        readonly=True,
+        copy=False,
+        help='Mailbox historyId of the last import, used to fetch only new messages'
+    )
     
     @api.depends('access_token', 'refresh_token')
     def _compute_is_authenticated(self):
@@ -53,4 +130,53 @@ class GoogleCredentials(models.Model):
             'access_token': False,
             'refresh_token': False,
             'token_expiry': False,
+            'history_id': False,
         })
+    
+    def action_reset_sync(self):
+        """Force the next import to re-list the whole mailbox"""
+        self.write({'history_id': False})
+    
+    def _refresh_access_token(self):
+        """Exchange the refresh token for a new access token and store it"""
+        self.ensure_one()
+        creds = Credentials(
+            token=None,
+            refresh_token=self.refresh_token,
+            token_uri=TOKEN_URI,
+            client_id=self.client_id,
+            client_secret=self.client_secret,
+        )
+        try:
+            creds.refresh(Request())
+        except RefreshError as e:
+            _logger.error(f"Token refresh failed for credentials {self.id}: {str(e)}")
+            raise UserError(f'Google token refresh failed, please authenticate again: {str(e)}')
+        
+        # google-auth reports expiry as naive UTC, which is what Odoo stores
+        self.write({
+            'access_token': creds.token,
+            'token_expiry': creds.expiry,
+        })
+    
+    def _get_gmail_token_info(self):
+        """Return plain token values for building a Gmail client, refreshing first if needed"""
+        self.ensure_one()
+        if not self.token_expiry or self.token_expiry - TOKEN_REFRESH_MARGIN <= fields.Datetime.now():
+            self._refresh_access_token()
+        return {
+            'token': self.access_token,
+            'refresh_token': self.refresh_token,
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+            'expiry': self.token_expiry,
+        }
+    
+    def _get_gmail_cache_key(self):
+        self.ensure_one()
+        return (self.env.cr.dbname, self.id)
+    
+    def _get_gmail_service(self):
+        """Return a cached Gmail API client with a valid access token"""
+        self.ensure_one()
+        return get_gmail_service(self._get_gmail_cache_key(), self._get_gmail_token_info())
@@ -0,0 +1,160 @@
+"""PDF text extraction and transaction matching for bank statements.
+
+Nothing in here touches Odoo: parse_statement_pdf and
+parse_statement_text only take plain values, as called by
+EmailStatement._download_and_parse_pdfs.
+
+Page text is extracted and matched one page at a time, so the text of
+a long statement is never held in full; the PDF file itself is. The bank
+patterns live in statement_parsers.
+"""
+from collections import deque
+import io
+
+from .statement_parsers import match_transactions
+
+# Extracted text longer than this is not returned for caching; such
+# statements are extracted again from the stored PDF when re-parsed
+MAX_CACHED_TEXT = 2 * 1024 * 1024
+# Pages whose first characters are shown in the parsing log
+LOG_PAGE_PREVIEWS = 3
+
+
+class PdfPasswordError(Exception):
+    """The PDF is encrypted; args[0] is 'password_required' or 'bad_password'"""
+
+
+class BoundedLog:
+    """Parsing log keeping the first and last lines only.
+
+    Drop-in for the plain lists the parsers append to, so a statement with
+    hundreds of pages still produces a short log with its summary intact.
+    """
+
+    def __init__(self, head=300, tail=100):
+        self.head = []
+        self.head_size = head
+        self.tail = deque(maxlen=tail)
+        self.omitted = 0
+
+    def append(self, line):
+        if len(self.head) < self.head_size:
+            self.head.append(line)
+            return
+        if len(self.tail) == self.tail.maxlen:
+            self.omitted += 1
+        self.tail.append(line)
+
+    def extend(self, lines):
+        for line in lines:
+            self.append(line)
+
+    def lines(self):
+        lines = list(self.head)
+        if self.omitted:
+            lines.append(f"\n... {self.omitted} log lines omitted ...\n")
+        lines.extend(self.tail)
+        return lines
+
+    def text(self):
+        return ''.join(self.lines())
+
+
+def iter_pdf_pages(pdf_source, password=None, log=None):
+    """Yield the text of a statement PDF page by page.
+
+    pdf_source is either the PDF bytes or a path to the file. Only the
+    page text is produced lazily: PyPDF2 reads the whole file into memory
+    when opening it, and only the pdfplumber fallback reads a path from
+    disk as needed. Raises PdfPasswordError before the first page when the
+    PDF cannot be opened.
+    """
+    log = log if log is not None else []
+    if isinstance(pdf_source, (bytes, bytearray)):
+        pdf_source = io.BytesIO(pdf_source)
+
+    # Try PyPDF2
+    try:
+        import PyPDF2
+    except ImportError:
+        PyPDF2 = None
+
+    if PyPDF2:
+        pdf_reader = PyPDF2.PdfReader(pdf_source)
+
+        if pdf_reader.is_encrypted:
+            log.append("PDF is password protected\n")
+            if not password:
+                raise PdfPasswordError('password_required')
+
+            if pdf_reader.decrypt(password) == 0:
+                raise PdfPasswordError('bad_password')
+            log.append("PDF decrypted successfully\n")
+
+        log.append(f"Using PyPDF2, found {len(pdf_reader.pages)} pages\n")
+        pages = (page.extract_text() or '' for page in pdf_reader.pages)
+        yield from _logged_pages(pages, log)
+    else:
+        log.append("PyPDF2 not available, trying pdfplumber\n")
+        import pdfplumber
+
+        with pdfplumber.open(pdf_source, password=password or None) as pdf:
+            yield from _logged_pages(_pdfplumber_pages(pdf), log)
+
+
+def _pdfplumber_pages(pdf):
+    for page in pdf.pages:
+        page_text = page.extract_text() or ''
+        # Parsed layout objects are not needed once the text is out
+        page.flush_cache()
+        yield page_text
+
+
+def _logged_pages(pages, log):
+    count = 0
+    for count, page_text in enumerate(pages, 1):
+        if count <= LOG_PAGE_PREVIEWS:
+            log.append(f"\n--- Page {count} (first 300 chars) ---\n{page_text[:300]}...\n")
+        yield page_text
+    log.append(f"\nRead {count} pages\n")
+
+
+def _keep_text(pages, kept):
+    """Pass pages through, keeping their text while it stays under MAX_CACHED_TEXT"""
+    size = 0
+    for page_text in pages:
+        if kept['pages'] is not None:
+            size += len(page_text)
+            if size <= MAX_CACHED_TEXT:
+                kept['pages'].append(page_text)
+            else:
+                kept['pages'] = None
+        yield page_text
+
+
+def parse_statement_pdf(pdf_source, password=None, bank_name=None):
+    """Extract and match the transactions of a statement PDF.
+
+    Returns a dict with the matched 'transactions', the extracted 'text'
+    (None when it exceeds MAX_CACHED_TEXT), a bounded list of 'log' lines
+    and an 'error' code: None, 'password_required' or 'bad_password'.
+    """
+    log = BoundedLog()
+    kept = {'pages': []}
+    try:
+        transactions = match_transactions(
+            _keep_text(iter_pdf_pages(pdf_source, password, log), kept), bank_name, log
+        )
+    except PdfPasswordError as e:
+        return {'transactions': [], 'text': None, 'log': log.lines(), 'error': e.args[0]}
+
+    text = ''.join(kept['pages']) if kept['pages'] is not None else None
+    return {'transactions': transactions, 'text': text, 'log': log.lines(), 'error': None}
+
+
+def parse_statement_text(text, bank_name=None):
+    """Match the transactions of previously extracted statement text"""
+    log = BoundedLog()
+    log.append("Reusing text extracted from an identical PDF\n")
+    transactions = match_transactions([text], bank_name, log)
+    return {'transactions': transactions, 'text': None, 'log': log.lines(), 'error': None}
@@ -0,0 +1,190 @@
+"""Bank statement parser registry.
+
+Each bank is a StatementParser registered under its email.statement
+bank_name. Other modules add banks by calling register_parser() at import
+time; no change to email.statement is needed, since the parser is also
+detected from the first page of the statement.
+
+Like pdf_extraction, nothing in here touches Odoo.
+"""
+from datetime import datetime
+import re
+
+# Lines held back at the end of every page so a row split by the page
+# break (date, description and amount on separate lines) still matches
+CARRY_LINES = 3
+# Characters of the first page searched for a bank's markers
+DETECT_CHARS = 4000
+
+
+class StatementParser:
+    """Transaction row patterns of one bank.
+
+    patterns is a list of (regex, date format); every regex has three
+    groups: date, description and amount. They are compiled into a single
+    alternation so each page is scanned once whatever its date format.
+    detect is a regex matching text found on the bank's first page.
+    Bump version when the patterns change to get cached statements re-parsed.
+    """
+
+    def __init__(self, bank_name, label, ref_prefix, patterns, detect=None, version='1'):
+        self.bank_name = bank_name
+        self.label = label
+        self.ref_prefix = ref_prefix
+        self.detect = re.compile(detect, re.IGNORECASE) if detect else None
+        self.version = version
+
+        # (date format, first group of the alternative) per alternative
+        self.formats = []
+        alternatives = []
+        group = 1
+        for index, (pattern, date_fmt) in enumerate(patterns):
+            if re.compile(pattern).groups != 3:
+                raise ValueError(f"{bank_name} pattern {index + 1} must have 3 groups: {pattern}")
+            alternatives.append(f'(?P<p{index}>{pattern})')
+            self.formats.append((date_fmt, group + 1))
+            group += 4
+        self.pattern = re.compile('|'.join(alternatives), re.MULTILINE)
+
+    def to_transaction(self, match):
+        """Convert a row match into a transaction dict; raises ValueError on bad rows"""
+        date_fmt, group = self.formats[int(match.lastgroup[1:])]
+        trans_date = datetime.strptime(match.group(group), date_fmt).date()
+        description = match.group(group + 1).strip()
+        amount = float(match.group(group + 2).replace('R', '').replace(',', ''))
+
+        return {
+            'date': trans_date,
+            'description': description,
+            'amount': abs(amount),
+            'type': 'debit' if amount < 0 else 'credit',
+            'reference': f"{self.ref_prefix}-{trans_date.strftime('%Y%m%d')}"
+        }
+
+
+_parsers = {}
+_detector = None
+
+
+def register_parser(parser):
+    """Add or replace the parser of parser.bank_name"""
+    global _detector
+    _parsers[parser.bank_name] = parser
+    _detector = None
+    return parser
+
+
+def get_parser(bank_name):
+    return _parsers.get(bank_name) or _parsers['other']
+
+
+def registry_version():
+    """Version of all registered parsers, stored on cached PDFs to spot stale parses"""
+    return ','.join(f'{name}:{parser.version}' for name, parser in sorted(_parsers.items()))
+
+
+def detect_parser(bank_name, first_page):
+    """Pick the parser for a statement from its first page.
+
+    The parser of bank_name (derived from the sender) is kept when its
+    markers are on the page; otherwise the bank whose markers are found
+    wins, falling back to bank_name's parser.
+    """
+    global _detector
+    if _detector is None:
+        markers = [f'(?P<{name}>{parser.detect.pattern})' for name, parser in _parsers.items() if parser.detect]
+        _detector = re.compile('|'.join(markers) or r'(?!)', re.IGNORECASE)
+
+    head = first_page[:DETECT_CHARS]
+    hinted = _parsers.get(bank_name)
+    if hinted and hinted.detect and hinted.detect.search(head):
+        return hinted
+    match = _detector.search(head)
+    if match:
+        return _parsers[match.lastgroup]
+    return get_parser(bank_name)
+
+
+def _line_start(text, lines):
+    """Index where the last `lines` lines of text begin"""
+    pos = len(text)
+    for _ in range(lines):
+        pos = text.rfind('\n', 0, pos)
+        if pos < 0:
+            return 0
+    return pos + 1
+
+
+class _StreamMatcher:
+    """Runs a parser over a stream of pages"""
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.carry = ''
+        self.match_count = 0
+        self.transactions = []
+        self.errors = []
+
+    def feed(self, page_text, final=False):
+        buffer = self.carry + page_text
+        if final:
+            cut = keep = len(buffer)
+        else:
+            # Rows ending in the last lines may continue on the next page
+            cut = _line_start(buffer, CARRY_LINES)
+            keep = _line_start(buffer, 2 * CARRY_LINES)
+
+        end = 0
+        for match in self.parser.pattern.finditer(buffer):
+            if match.end() > cut:
+                break
+            self.match_count += 1
+            try:
+                self.transactions.append(self.parser.to_transaction(match))
+            except ValueError as e:
+                self.errors.append(str(e))
+            end = match.end()
+        self.carry = buffer[max(end, keep):]
+
+    def flush(self):
+        self.feed('', final=True)
+
+
+def match_transactions(pages, bank_name, log):
+    """Match statement rows in an iterable of page texts"""
+    pages = iter(pages)
+    first_page = next(pages, '')
+    parser = detect_parser(bank_name, first_page)
+    log.append(f"\n=== {parser.label} PATTERNS ===\n")
+    if parser.bank_name != bank_name:
+        log.append(f"Detected {parser.bank_name} from the first page\n")
+
+    matcher = _StreamMatcher(parser)
+    matcher.feed(first_page)
+    for page_text in pages:
+        matcher.feed(page_text)
+    matcher.flush()
+
+    log.append(f"Matches: {matcher.match_count}\n")
+    for error in matcher.errors:
+        log.append(f"✗ Error: {error}\n")
+    for trans in matcher.transactions:
+        log.append(f"✓ {trans['date']} | {trans['description'][:20]} | {trans['amount']}\n")
+    return matcher.transactions
+
+
+register_parser(StatementParser('tymebank', 'TYMEBANK', 'TYME', [
+    (r'(\d{2}\s+\w{3}\s+\d{4})\s+([^\t\n]+?)\s+(-?R[\d,]+\.\d{2})', '%d %b %Y'),
+    (r'(\d{4}-\d{2}-\d{2})\s+([^\t\n]+?)\s+(-?R?[\d,]+\.\d{2})', '%Y-%m-%d'),
+    (r'(\d{2}/\d{2}/\d{4})\s+([^\t\n]+?)\s+(-?R?[\d,]+\.\d{2})', '%d/%m/%Y'),
+], detect=r'tyme\s?bank'))
+
+register_parser(StatementParser('capitec', 'CAPITEC', 'CAP', [
+    (r'(\d{4}/\d{2}/\d{2})\s+([^\t\n]+?)\s+(-?[\d,]+\.\d{2})', '%Y/%m/%d'),
+    (r'(\d{2}/\d{2}/\d{4})\s+([^\t\n]+?)\s+(-?R?[\d,]+\.\d{2})', '%d/%m/%Y'),
+], detect=r'capitec'))
+
+register_parser(StatementParser('other', 'GENERIC', 'GEN', [
+    (r'(\d{2}/\d{2}/\d{4})\s+([^\d\-\+\$R]+)\s+(-?R?[\d,]+\.\d{2})', '%d/%m/%Y'),
+    (r'(\d{4}-\d{2}-\d{2})\s+([^\d\-\+\$R]+)\s+(-?R?[\d,]+\.\d{2})', '%Y-%m-%d'),
+]))
@@ -0,0 +1,42 @@
+from odoo import models, fields, api
+import hashlib
+
+
+class EmailStatementPdf(models.Model):
+    _name = 'email.statement.pdf'
+    _description = 'Statement PDF Cache'
+    _order = 'statement_id, id'
+
+    statement_id = fields.Many2one(
+        'email.statement',
+        string='Statement',
+        required=True,
+        ondelete='cascade',
+        index=True
+    )
+    filename = fields.Char(string='Filename')
+    gmail_part_id = fields.Char(
+        string='Gmail Part ID',
+        required=True,
+        help='MIME part of the message holding the PDF; unlike attachment IDs it never changes'
+    )
+    gmail_attachment_id = fields.Char(string='Gmail Attachment ID', help='Attachment ID seen at the last download')
+    attachment_id = fields.Many2one('ir.attachment', string='Stored PDF', ondelete='set null')
+    sha256 = fields.Char(string='SHA-256', index=True)
+
+    # Extraction results, valid for the password they were extracted with
+    extracted_text = fields.Text(string='Extracted Text')
+    password_fingerprint = fields.Char(
+        string='Password Fingerprint',
+        help='SHA-256 of the PDF password used for extracted_text; empty until extraction succeeded'
+    )
+    parser_version = fields.Char(string='Parser Version', help='Bank parser version that produced the transactions')
+
+    _sql_constraints = [
+        ('statement_part_unique', 'UNIQUE(statement_id, gmail_part_id)', 'This PDF is already cached for the statement!')
+    ]
+
+    @api.model
+    def _password_fingerprint(self, password):
+        """Hash a PDF password so changes can be detected without storing it twice"""
+        return hashlib.sha256((password or '').encode('utf-8')).hexdigest()
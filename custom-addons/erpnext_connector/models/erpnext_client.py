@@ -0,0 +1,230 @@
+"""HTTP client shared by everything that talks to ERPNext.
+
+ERPNextConfig._get_client() hands out ERPNextClient objects; their
+keep-alive session and rate limiter live here, one per configuration and
+process, so every caller and worker thread shares the same connections
+and request budget. Nothing in here touches the Odoo cursor, so clients
+can be used from worker threads.
+"""
+from requests.adapters import HTTPAdapter
+import json
+import logging
+import random
+import requests
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Statuses worth retrying: rate limited, or the server is (temporarily) failing
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Statuses where the server did not process the request, safe to retry for any method
+UNPROCESSED_STATUSES = {429, 503}
+# Transport failures that may be transient: retried for idempotent requests,
+# other requests are only retried on a connect timeout
+TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+CONNECT_TIMEOUT = 10
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+# Documents requested per page by iter_pages / iter_list
+LIST_PAGE_LENGTH = 500
+# frappe.client.insert_many refuses more than 200 documents per request
+INSERT_MANY_LIMIT = 200
+# Statuses meaning a whitelisted method is missing or not allowed for this user
+UNAVAILABLE_STATUSES = {403, 404}
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+class EndpointUnavailable(Exception):
+    """The ERPNext server does not offer (or allow) the requested method"""
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` requests per second on average"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(rate, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, sleeping until one is available"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Reserve the token even when in debt, then wait the debt off outside the lock
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+def _get_shared(key, pool_size, rate_limit):
+    """Return the (session, rate limiter) of a configuration, creating them as needed"""
+    with _shared_lock:
+        shared = _shared.get(key)
+        if shared is None or shared['settings'] != (pool_size, rate_limit):
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            shared = _shared[key] = {
+                'settings': (pool_size, rate_limit),
+                'session': session,
+                'bucket': TokenBucket(rate_limit) if rate_limit > 0 else None,
+            }
+        return shared['session'], shared['bucket']
+
+
+class ERPNextClient:
+    """Pooled, rate limited ERPNext REST client with timeouts and retries.
+
+    GET requests are retried on 429, 5xx and connection errors with jittered
+    exponential backoff (honouring Retry-After). Other methods are only
+    retried when the server certainly did not process them (429, 503 or a
+    connect failure), unless the call is flagged idempotent.
+    """
+
+    def __init__(self, key, base_url, headers, timeout=60, max_retries=3, rate_limit=10, pool_size=4):
+        self.base_url = base_url.rstrip('/')
+        self.headers = headers
+        self.timeout = (CONNECT_TIMEOUT, timeout)
+        self.max_retries = max_retries
+        self.session, self.bucket = _get_shared(key, pool_size, rate_limit)
+
+    def request(self, method, path, idempotent=None, **kwargs):
+        """Send a request to base_url + path and return the decoded JSON response"""
+        if idempotent is None:
+            idempotent = method.upper() == 'GET'
+        url = f"{self.base_url}{path}"
+        attempt = 0
+
+        while True:
+            if self.bucket:
+                self.bucket.acquire()
+            try:
+                response = self.session.request(
+                    method, url, headers=self.headers, timeout=self.timeout, **kwargs
+                )
+            except TRANSIENT_ERRORS as e:
+                # A connect timeout means the request never reached the server
+                retryable = idempotent or isinstance(e, requests.ConnectTimeout)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                _logger.warning(f"ERPNext {method} {path} failed ({str(e)}), retrying in {delay:.1f}s")
+            else:
+                retry_statuses = RETRY_STATUSES if idempotent else UNPROCESSED_STATUSES
+                if response.status_code not in retry_statuses or attempt >= self.max_retries:
+                    response.raise_for_status()
+                    return response.json()
+                delay = self._backoff(attempt, response.headers.get('Retry-After'))
+                _logger.warning(
+                    f"ERPNext {method} {path} returned {response.status_code}, retrying in {delay:.1f}s"
+                )
+
+            time.sleep(delay)
+            attempt += 1
+
+    def _backoff(self, attempt, retry_after=None):
+        """Seconds to wait before the next attempt: Retry-After, else full-jitter exponential"""
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), BACKOFF_MAX)
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    def get(self, path, params=None, **kwargs):
+        return self.request('GET', path, params=params, **kwargs)
+
+    def post(self, path, payload, **kwargs):
+        return self.request('POST', path, json=payload, **kwargs)
+
+    def iter_pages(self, doctype, fields, filters=None, page_length=LIST_PAGE_LENGTH, order_by='name asc'):
+        """Yield the documents of a doctype list one page (list of dicts) at a time.
+
+        Pages through limit_start / limit_page_length in a stable order until
+        a short page comes back, so no list is truncated at Frappe's default
+        page length and only one page is held in memory at a time.
+        """
+        path = f"/api/resource/{doctype}"
+        params = {
+            'fields': json.dumps(fields),
+            'order_by': order_by,
+            'limit_page_length': page_length,
+        }
+        if filters:
+            params['filters'] = json.dumps(filters)
+        
+        start = 0
+        while True:
+            params['limit_start'] = start
+            page = self.get(path, params=params).get('data', [])
+            if page:
+                yield page
+            if len(page) < page_length:
+                return
+            start += len(page)
+
+    def iter_list(self, doctype, fields, filters=None, page_length=LIST_PAGE_LENGTH, order_by='name asc'):
+        """Yield the documents of a doctype list one by one, fetched page by page"""
+        for page in self.iter_pages(doctype, fields, filters, page_length, order_by):
+            yield from page
+
+    def insert_many(self, docs):
+        """Insert up to INSERT_MANY_LIMIT documents in one request and return their names.
+
+        Frappe inserts them in a single transaction, so either all are
+        created or the call fails. The names come back unordered; callers
+        map them back to their rows through a field of their own.
+        Raises EndpointUnavailable if the server does not allow the method.
+        """
+        try:
+            result = self.post('/api/method/frappe.client.insert_many', {'docs': docs})
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code in UNAVAILABLE_STATUSES:
+                raise EndpointUnavailable(f"frappe.client.insert_many is not available: {str(e)}") from e
+            raise
+        return list(result.get('message') or [])
+
+    def iter_changed(self, doctype, fields, since=None, filters=None, page_length=LIST_PAGE_LENGTH):
+        """Yield pages of the documents modified at or after `since`, oldest first.
+
+        Pages are keyed on (modified, name) instead of offsets, so documents
+        edited while the walk runs cannot shift others out of view: after a
+        full page ending at (m, n), the walk continues with the documents
+        modified at m named after n, then with those modified after m.
+        """
+        path = f"/api/resource/{doctype}"
+        params = {
+            'fields': json.dumps(list(fields) + ['modified']),
+            'order_by': 'modified asc, name asc',
+            'limit_page_length': page_length,
+            'limit_start': 0,
+        }
+        cursor = since
+        operator = '>='
+        last_name = None
+        while True:
+            page_filters = list(filters or [])
+            if last_name is not None:
+                page_filters += [['modified', '=', cursor], ['name', '>', last_name]]
+            elif cursor:
+                page_filters.append(['modified', operator, cursor])
+            params['filters'] = json.dumps(page_filters)
+            page = self.get(path, params=params).get('data', [])
+            if page:
+                yield page
+            
+            if len(page) == page_length:
+                cursor = page[-1]['modified']
+                last_name = page[-1]['name']
+            elif last_name is not None:
+                # Done with the documents sharing the cursor timestamp
+                operator = '>'
+                last_name = None
+            else:
+                return
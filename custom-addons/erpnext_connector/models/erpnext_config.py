@@ -1,10 +1,46 @@
 from odoo import models, fields, api
-import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .erpnext_client import ERPNextClient, EndpointUnavailable, INSERT_MANY_LIMIT, CONNECT_TIMEOUT, BACKOFF_MAX
 import json
 import logging
 
 _logger = logging.getLogger(__name__)
 
+# Synced transactions written back per commit by sync_transactions
+SYNC_COMMIT_BATCH = 50
+# References looked up per Journal Entry list request
+REFERENCE_LOOKUP_CHUNK = 200
+
+
+class SyncOutcomes:
+    """Collects journal entry push outcomes for sync_transactions.
+
+    Outcomes are written back through the configuration and committed
+    every SYNC_COMMIT_BATCH transactions, so finished pushes survive a
+    crash later in the run.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.pending = []
+        self.success_count = 0
+        self.failed_count = 0
+
+    def add(self, transaction, journal_entry_name=None, error_message=None):
+        self.pending.append((transaction, journal_entry_name, error_message))
+        if error_message is None:
+            self.success_count += 1
+        else:
+            self.failed_count += 1
+        if len(self.pending) >= SYNC_COMMIT_BATCH:
+            self.flush()
+
+    def flush(self):
+        self.config._record_journal_entry_results(self.pending)
+        self.pending = []
+        if not self.config.env.registry.in_test_mode():
+            self.config.env.cr.commit()
+
 class ERPNextConfig(models.Model):
     _name = 'erpnext.config'
     _description = 'ERPNext API Configuration'
@@ -21,6 +57,25 @@ class ERPNextConfig(models.Model):
     default_cost_center = fields.Char(string='Default Cost Center')
     bank_account = fields.Char(string='Bank Account', required=True, 
                                 help='ERPNext bank account name')
+    sync_concurrency = fields.Integer(string='Sync Concurrency', default=4,
+                                      help='Maximum number of simultaneous requests when pushing to ERPNext')
+    sync_mode = fields.Selection([
+        ('single', 'One Request per Entry'),
+        ('batch', 'Batch Insert'),
+        ('aggregate', 'Daily Entry per Category'),
+    ], string='Bulk Sync Mode', default='single', required=True,
+        help='How bulk syncs push journal entries: one request per transaction, '
+             'up to 200 entries per request through frappe.client.insert_many '
+             '(falling back to daily entries when the method is unavailable), or one '
+             'multi-line entry per day and category')
+    
+    # HTTP client settings
+    request_timeout = fields.Integer(string='Request Timeout (s)', default=60,
+                                     help='Seconds to wait for an ERPNext response before giving up')
+    max_retries = fields.Integer(string='Max Retries', default=3,
+                                 help='Retries on rate limiting, server errors and connection failures')
+    rate_limit = fields.Float(string='Rate Limit (req/s)', default=10,
+                              help='Maximum average requests per second to ERPNext; 0 disables the limit')
 
     def _get_headers(self):
         """Get API headers with authentication"""
@@ -31,19 +86,36 @@ class ERPNextConfig(models.Model):
             'Accept': 'application/json'
         }
 
+    def _get_client(self):
+        """ERPNext client sharing this configuration's pooled session and rate limit"""
+        self.ensure_one()
+        return ERPNextClient(
+            (self.env.cr.dbname, self.id),
+            self.base_url,
+            self._get_headers(),
+            timeout=self.request_timeout or 60,
+            max_retries=max(self.max_retries, 0),
+            rate_limit=self.rate_limit,
+            pool_size=max(self.sync_concurrency, 1),
+        )
+
+    def _max_request_seconds(self):
+        """Longest one request through _get_client() can take: every attempt times out after the longest backoff"""
+        self.ensure_one()
+        attempts = max(self.max_retries, 0) + 1
+        return attempts * (CONNECT_TIMEOUT + (self.request_timeout or 60) + BACKOFF_MAX)
+
     def test_connection(self):
         """Test ERPNext connection"""
         self.ensure_one()
         try:
-            url = f"{self.base_url}/api/method/frappe.auth.get_logged_user"
-            response = requests.get(url, headers=self._get_headers())
-            response.raise_for_status()
+            result = self._get_client().get('/api/method/frappe.auth.get_logged_user')
             return {
                 'type': 'ir.actions.client',
                 'tag': 'display_notification',
                 'params': {
                     'title': 'Connection Successful',
-                    'message': f"Connected as: {response.json().get('message')}",
+                    'message': f"Connected as: {result.get('message')}",
                     'type': 'success',
                 }
             }
@@ -59,8 +131,8 @@ class ERPNextConfig(models.Model):
                 }
             }
 
-    def create_journal_entry(self, transaction):
-        """Create Journal Entry in ERPNext from bank transaction"""
+    def _prepare_journal_entry(self, transaction):
+        """Build the ERPNext Journal Entry document of a bank transaction"""
         self.ensure_one()
         
         # FIXED: Use transaction.date instead of transaction.transaction_date
@@ -81,7 +153,7 @@ class ERPNextConfig(models.Model):
             expense_debit = 0
         
         # Prepare journal entry data
-        journal_data = {
+        return {
             'doctype': 'Journal Entry',
             'company': self.default_company,
             'posting_date': posting_date,
@@ -100,59 +172,344 @@ class ERPNextConfig(models.Model):
             ],
             'user_remark': transaction.description or '',
             'reference_number': transaction.reference or '',
+            'cheque_no': self._journal_entry_reference(transaction),
+            'cheque_date': posting_date,
         }
+
+    def _journal_entry_reference(self, transaction):
+        """Deterministic reference (sent as cheque_no) of the Journal Entry pushed for a bank transaction.
+
+        The same transaction always gets the same reference, so entries an
+        earlier attempt created can be found in ERPNext before pushing again.
+        """
+        return f"ODOO-{transaction.statement_id.id}-{transaction.id}"
+
+    def _aggregated_journal_entry_reference(self, transactions):
+        """Reference of the aggregated Journal Entry of transactions sharing a date and category.
+
+        Built from the group (configuration, date, category) and its lowest
+        transaction id. Members store it before the push and never join
+        another entry, so retries reuse it whatever else was queued since.
+        """
+        first = transactions.sorted('id')[0]
+        return f"ODOO-AGG-{self.id}-{first.date:%Y%m%d}-{first.category_id.id}-{first.id}"
+
+    @staticmethod
+    def _find_journal_entries(client, references):
+        """Return {reference: name} of the non-cancelled Journal Entries carrying these references.
+
+        One paged list request per REFERENCE_LOOKUP_CHUNK references; safe to
+        call from worker threads.
+        """
+        references = list(references)
+        found = {}
+        for index in range(0, len(references), REFERENCE_LOOKUP_CHUNK):
+            filters = [
+                ['cheque_no', 'in', references[index:index + REFERENCE_LOOKUP_CHUNK]],
+                ['docstatus', '!=', 2],
+            ]
+            for entry in client.iter_list('Journal Entry', ['name', 'cheque_no'], filters):
+                found[entry['cheque_no']] = entry['name']
+        return found
+
+    def _skip_existing(self, client, documents, outcomes):
+        """Record documents already in ERPNext as synced and return the ones still to push"""
+        existing = self._find_journal_entries(client, [journal_data['cheque_no'] for _transaction, journal_data in documents])
+        remaining = []
+        for transaction, journal_data in documents:
+            name = existing.get(journal_data['cheque_no'])
+            if name:
+                _logger.info(f"Transaction {transaction.id} already has Journal Entry {name} in ERPNext")
+                outcomes.add(transaction, name)
+            else:
+                remaining.append((transaction, journal_data))
+        return remaining
+
+    def _prepare_aggregated_journal_entry(self, transactions):
+        """Build one Journal Entry for transactions sharing a date and category.
+
+        Each transaction gets its own category line; the bank side is a
+        single line for the net amount.
+        """
+        self.ensure_one()
+        first = transactions[0]
+        posting_date = first.date.strftime('%Y-%m-%d')
         
-        url = f"{self.base_url}/api/resource/Journal Entry"
+        accounts = []
+        bank_net = 0.0
+        for transaction in transactions:
+            amount = abs(transaction.amount)
+            if transaction.transaction_type == 'debit':
+                # Money out: Debit expense
+                debit, credit = amount, 0
+                bank_net -= amount
+            else:
+                # Money in: Credit income
+                debit, credit = 0, amount
+                bank_net += amount
+            accounts.append({
+                'account': first.category_id.erpnext_account,
+                'debit_in_account_currency': debit,
+                'credit_in_account_currency': credit,
+                'cost_center': self.default_cost_center,
+                'user_remark': transaction.description or '',
+            })
         
-        try:
-            response = requests.post(
-                url,
-                headers=self._get_headers(),
-                json=journal_data
-            )
-            response.raise_for_status()
-            result = response.json()
-            
-            journal_entry_name = result.get('data', {}).get('name')
-            
-            # Update transaction
-            transaction.write({
+        if bank_net:
+            accounts.insert(0, {
+                'account': self.bank_account,
+                'debit_in_account_currency': max(bank_net, 0),
+                'credit_in_account_currency': max(-bank_net, 0),
+            })
+        
+        return {
+            'doctype': 'Journal Entry',
+            'company': self.default_company,
+            'posting_date': posting_date,
+            'accounts': accounts,
+            'user_remark': f"{first.category_id.name}: {len(transactions)} bank transactions",
+            'cheque_no': self._aggregated_journal_entry_reference(transactions),
+            'cheque_date': posting_date,
+        }
+
+    def _record_journal_entry_result(self, transaction, journal_entry_name=None, error_message=None):
+        """Store the outcome of a journal entry push on the transaction and in the sync log"""
+        self._record_journal_entry_results([(transaction, journal_entry_name, error_message)])
+
+    def _record_journal_entry_results(self, results):
+        """Store many (transaction, journal entry name, error message) outcomes at once.
+
+        Transactions sharing an outcome are written together and the sync
+        log rows are created in a single call.
+        """
+        self.ensure_one()
+        synced = {}
+        errors = {}
+        log_vals = []
+        for transaction, journal_entry_name, error_message in results:
+            if error_message is None:
+                synced.setdefault(journal_entry_name, []).append(transaction.id)
+                log_vals.append({
+                    'config_id': self.id,
+                    'record_type': 'bank_transaction',
+                    'record_id': transaction.id,
+                    'erpnext_doctype': 'Journal Entry',
+                    'erpnext_doc_name': journal_entry_name,
+                    'status': 'success'
+                })
+                _logger.info(f"Successfully synced transaction {transaction.id} to ERPNext: {journal_entry_name}")
+            else:
+                errors.setdefault(error_message, []).append(transaction.id)
+                log_vals.append({
+                    'config_id': self.id,
+                    'record_type': 'bank_transaction',
+                    'record_id': transaction.id,
+                    'status': 'failed',
+                    'error_message': error_message
+                })
+                _logger.error(f"Failed to create journal entry: {error_message}")
+        
+        Transaction = self.env['bank.transaction']
+        now = fields.Datetime.now()
+        for journal_entry_name, transaction_ids in synced.items():
+            Transaction.browse(transaction_ids).write({
                 'erpnext_synced': True,
                 'erpnext_journal_entry': journal_entry_name,
-                'erpnext_sync_date': fields.Datetime.now(),
+                'erpnext_sync_date': now,
                 'erpnext_error': False,
             })
-            
-            # Log sync
-            self.env['erpnext.sync.log'].create({
-                'config_id': self.id,
-                'record_type': 'bank_transaction',
-                'record_id': transaction.id,
-                'erpnext_doctype': 'Journal Entry',
-                'erpnext_doc_name': journal_entry_name,
-                'status': 'success'
-            })
-            
-            _logger.info(f"Successfully synced transaction {transaction.id} to ERPNext: {journal_entry_name}")
-            
-            return result
-            
-        except Exception as e:
-            error_message = str(e)
-            _logger.error(f"Failed to create journal entry: {error_message}")
-            
-            # Update transaction with error
-            transaction.write({
+        for error_message, transaction_ids in errors.items():
+            Transaction.browse(transaction_ids).write({
                 'erpnext_error': error_message
             })
-            
-            # Log failure
-            self.env['erpnext.sync.log'].create({
-                'config_id': self.id,
-                'record_type': 'bank_transaction',
-                'record_id': transaction.id,
-                'status': 'failed',
-                'error_message': error_message
-            })
-            
+        
+        if log_vals:
+            self.env['erpnext.sync.log'].create(log_vals)
+
+    def create_journal_entry(self, transaction):
+        """Create Journal Entry in ERPNext from bank transaction"""
+        self.ensure_one()
+        journal_data = self._prepare_journal_entry(transaction)
+        
+        try:
+            result = self._get_client().post('/api/resource/Journal Entry', journal_data)
+        except Exception as e:
+            self._record_journal_entry_result(transaction, error_message=str(e))
             raise
+        
+        self._record_journal_entry_result(transaction, result.get('data', {}).get('name'))
+        return result
+
+    def _run_concurrently(self, calls):
+        """Run {key: (function, *args)} on sync_concurrency threads.
+
+        Yields (key, result, exception) in completion order. Only plain
+        values may be passed to the functions: they run outside the cursor.
+        """
+        with ThreadPoolExecutor(max_workers=max(self.sync_concurrency, 1)) as executor:
+            futures = {executor.submit(*call): key for key, call in calls.items()}
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+
+    def sync_transactions(self, transactions, check_existing=False):
+        """Push many transactions as Journal Entries according to sync_mode.
+
+        Worker threads only send the prepared documents through the shared
+        client; results are written back by the calling thread and
+        committed every SYNC_COMMIT_BATCH transactions. When retrying
+        (check_existing), entries an earlier attempt already created are
+        looked up by reference first and not pushed again.
+        Returns (success count, failed count).
+        """
+        self.ensure_one()
+        outcomes = SyncOutcomes(self)
+        documents = []
+        for transaction in transactions:
+            try:
+                documents.append((transaction, self._prepare_journal_entry(transaction)))
+            except Exception as e:
+                outcomes.add(transaction, error_message=str(e))
+        
+        if check_existing and documents:
+            documents = self._skip_existing(self._get_client(), documents, outcomes)
+        
+        if self.sync_mode == 'aggregate':
+            self._push_aggregated(documents, outcomes)
+        else:
+            # Transactions once pushed in an aggregated entry stay with it
+            carried = [document for document in documents if document[0].erpnext_aggregate_reference]
+            if carried:
+                self._push_aggregated(carried, outcomes)
+                documents = [document for document in documents if not document[0].erpnext_aggregate_reference]
+            if self.sync_mode == 'batch':
+                self._push_batches(documents, outcomes)
+            else:
+                self._push_single(documents, outcomes)
+        outcomes.flush()
+        
+        self.last_sync = fields.Datetime.now()
+        return outcomes.success_count, outcomes.failed_count
+
+    def _push_single(self, documents, outcomes):
+        """POST one Journal Entry per transaction"""
+        client = self._get_client()
+        calls = {
+            transaction: (client.post, '/api/resource/Journal Entry', journal_data)
+            for transaction, journal_data in documents
+        }
+        for transaction, result, error in self._run_concurrently(calls):
+            if error:
+                outcomes.add(transaction, error_message=str(error))
+            else:
+                outcomes.add(transaction, result.get('data', {}).get('name'))
+
+    def _push_batches(self, documents, outcomes):
+        """Insert Journal Entries INSERT_MANY_LIMIT at a time through frappe.client.insert_many.
+
+        A failed batch is all-or-nothing on the ERPNext side, so its rows are
+        pushed one by one to find the culprits, after checking that the
+        batch was not committed before its response got lost. If the server
+        does not allow insert_many, the remaining transactions are
+        aggregated instead.
+        """
+        client = self._get_client()
+        batches = {
+            index: documents[index:index + INSERT_MANY_LIMIT]
+            for index in range(0, len(documents), INSERT_MANY_LIMIT)
+        }
+        calls = {
+            index: (self._insert_journal_entries, client, [journal_data for _transaction, journal_data in batch])
+            for index, batch in batches.items()
+        }
+        
+        retry_single = []
+        unavailable = []
+        for index, names_by_reference, error in self._run_concurrently(calls):
+            batch = batches[index]
+            if isinstance(error, EndpointUnavailable):
+                unavailable.extend(batch)
+                continue
+            if error:
+                _logger.warning(f"Batch insert of {len(batch)} journal entries failed, pushing them one by one: {str(error)}")
+                retry_single.extend(batch)
+                continue
+            for transaction, journal_data in batch:
+                outcomes.add(transaction, names_by_reference.get(journal_data['cheque_no']))
+        
+        if retry_single:
+            self._push_single(self._skip_existing(client, retry_single, outcomes), outcomes)
+        if unavailable:
+            _logger.warning("frappe.client.insert_many is unavailable, aggregating journal entries per day and category")
+            self._push_aggregated(unavailable, outcomes)
+
+    @staticmethod
+    def _insert_journal_entries(client, docs):
+        """Insert docs in one request and return {cheque_no: journal entry name} (worker thread)"""
+        names = client.insert_many(docs)
+        if not names:
+            return {}
+        try:
+            return ERPNextConfig._find_journal_entries(client, [doc['cheque_no'] for doc in docs])
+        except Exception as e:
+            # The entries exist: report them synced without names rather than push them again
+            _logger.error(f"Could not look up inserted journal entries {names}: {str(e)}")
+            return {}
+
+    def _push_aggregated(self, documents, outcomes):
+        """POST one multi-line Journal Entry per date and category.
+
+        Members store their entry's reference, committed before the push.
+        Transactions that already carry one are looked up in ERPNext first:
+        if their entry exists they are recorded as synced, otherwise they
+        are grouped again like new transactions.
+        """
+        client = self._get_client()
+        carried = {}
+        fresh = []
+        for transaction, journal_data in documents:
+            if transaction.erpnext_aggregate_reference:
+                carried.setdefault(transaction.erpnext_aggregate_reference, []).append((transaction, journal_data))
+            else:
+                fresh.append((transaction, journal_data))
+        
+        if carried:
+            existing = self._find_journal_entries(client, list(carried))
+            for reference, members in carried.items():
+                if reference in existing:
+                    for transaction, _journal_data in members:
+                        outcomes.add(transaction, existing[reference])
+                else:
+                    fresh.extend(members)
+        
+        groups = {}
+        for transaction, _journal_data in fresh:
+            key = (transaction.date, transaction.category_id.id)
+            groups[key] = groups.get(key, self.env['bank.transaction']) | transaction
+        
+        entries = {}
+        for group in groups.values():
+            try:
+                entries[group] = self._prepare_aggregated_journal_entry(group)
+            except Exception as e:
+                for transaction in group:
+                    outcomes.add(transaction, error_message=str(e))
+        
+        for group, entry in entries.items():
+            group.write({'erpnext_aggregate_reference': entry['cheque_no']})
+        # Stored before pushing, so a retry finds the entry even if the response is lost
+        outcomes.flush()
+        
+        calls = {
+            group: (client.post, '/api/resource/Journal Entry', entry)
+            for group, entry in entries.items()
+        }
+        
+        for group, result, error in self._run_concurrently(calls):
+            for transaction in group:
+                if error:
+                    outcomes.add(transaction, error_message=str(error))
+                else:
+                    outcomes.add(transaction, result.get('data', {}).get('name'))
@@ -9,6 +9,7 @@
         - Adds transaction categorization
         - Enables one-click sync to ERPNext
         - Bulk sync capabilities
+        - Queued, retried background sync to ERPNext
     """,
     'author': 'Your Company',
     'depends': ['GMailer', 'erpnext_connector'],
@@ -16,7 +17,9 @@
         'security/ir.model.access.csv',
         'views/transaction_category_views.xml',
         'views/bank_transaction_extended_views.xml',
+        'views/erpnext_sync_job_views.xml',
         'data/default_categories.xml',
+        'data/cron_jobs.xml',
     ],
     'installable': True,
     'application': False,
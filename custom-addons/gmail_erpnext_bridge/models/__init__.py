@@ -1,2 +1,3 @@
 from . import bank_transaction_extended
 from . import transaction_category
+from . import erpnext_sync_job
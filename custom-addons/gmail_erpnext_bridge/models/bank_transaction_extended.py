@@ -1,9 +1,13 @@
 from odoo import models, fields, api
 from odoo.exceptions import UserError
+from collections import defaultdict
 import logging
 
 _logger = logging.getLogger(__name__)
 
+# Transactions matched and committed together by the bulk auto-categorization
+CATEGORIZE_CHUNK_SIZE = 5000
+
 class BankTransactionExtended(models.Model):
     _inherit = 'bank.transaction'
 
@@ -28,6 +32,12 @@ class BankTransactionExtended(models.Model):
         readonly=True,
         help='Reference to the Journal Entry created in ERPNext'
     )
+    erpnext_aggregate_reference = fields.Char(
+        string='ERPNext Aggregate Reference',
+        readonly=True,
+        copy=False,
+        help='Reference of the aggregated Journal Entry this transaction was pushed in; retries look it up instead of pushing again'
+    )
     erpnext_sync_date = fields.Datetime(
         string='Sync Date',
         readonly=True
@@ -44,14 +54,11 @@ class BankTransactionExtended(models.Model):
 
     def action_auto_categorize(self):
         """Automatically categorize based on description"""
-        for record in self:
-            if not record.category_id:
-                category = self.env['transaction.category'].auto_categorize_transaction(
-                    record.description
-                )
-                if category:
-                    record.category_id = category
-                    _logger.info(f"Auto-categorized transaction {record.id} as {category.name}")
+        uncategorized = self.filtered(lambda r: not r.category_id)
+        category_ids = self.env['transaction.category'].match_category_ids(
+            uncategorized.mapped('description')
+        )
+        self._write_categories(zip(uncategorized.ids, category_ids))
 
     def action_sync_to_erpnext(self):
         """Sync single transaction to ERPNext"""
@@ -68,49 +75,81 @@ class BankTransactionExtended(models.Model):
         if not config:
             raise UserError('No active ERPNext configuration found. Please configure ERPNext connection first.')
         
-        try:
-            result = config.create_journal_entry(self)
-            return {
-                'type': 'ir.actions.client',
-                'tag': 'display_notification',
-                'params': {
-                    'title': 'Sync Successful',
-                    'message': f'Transaction synced to ERPNext: {self.erpnext_journal_entry}',
-                    'type': 'success',
-                }
+        # Pushed by the ERPNext sync queue cron, not within this request
+        self.env['erpnext.sync.job'].enqueue(self, config)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Sync Queued',
+                'message': 'The transaction will be synced to ERPNext shortly.',
+                'type': 'info',
             }
-        except Exception as e:
-            _logger.error(f"Failed to sync transaction {self.id}: {str(e)}")
-            self.erpnext_error = str(e)
-            raise UserError(f'Failed to sync to ERPNext: {str(e)}')
+        }
 
     @api.model
     def action_bulk_auto_categorize(self):
         """Bulk auto-categorize all uncategorized transactions"""
-        uncategorized = self.search([
-            ('category_id', '=', False),
-            ('erpnext_synced', '=', False)
-        ])
-        
-        categorized_count = 0
-        for transaction in uncategorized:
-            category = self.env['transaction.category'].auto_categorize_transaction(
-                transaction.description
-            )
-            if category:
-                transaction.category_id = category
-                categorized_count += 1
+        categorized_count, scanned_count = self._bulk_auto_categorize()
         
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
             'params': {
                 'title': 'Auto-Categorization Complete',
-                'message': f'Categorized {categorized_count} of {len(uncategorized)} transactions',
+                'message': f'Categorized {categorized_count} of {scanned_count} transactions',
                 'type': 'success',
             }
         }
 
+    @api.model
+    def _bulk_auto_categorize(self, chunk_size=CATEGORIZE_CHUNK_SIZE):
+        """Categorize all uncategorized transactions, one committed chunk at a time.
+
+        Chunks are walked by id and matched in one pass, so a run stopped by
+        the worker time limit keeps what it did and the next run carries on
+        with the transactions that are still uncategorized.
+        Returns (categorized count, scanned count).
+        """
+        Category = self.env['transaction.category']
+        domain = [('category_id', '=', False), ('erpnext_synced', '=', False)]
+        categorized_count = 0
+        scanned_count = 0
+        last_id = 0
+        
+        while True:
+            rows = self.search_read(
+                domain + [('id', '>', last_id)], ['description'], order='id', limit=chunk_size
+            )
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+            scanned_count += len(rows)
+            
+            category_ids = Category.match_category_ids([row['description'] for row in rows])
+            categorized_count += self._write_categories(
+                (row['id'], category_id) for row, category_id in zip(rows, category_ids)
+            )
+            
+            if not self.env.registry.in_test_mode():
+                self.env.cr.commit()
+            # Keep memory flat across chunks
+            self.env.invalidate_all()
+            _logger.info(f"Auto-categorized {categorized_count} of {scanned_count} transactions so far")
+        
+        return categorized_count, scanned_count
+
+    def _write_categories(self, matches):
+        """Apply (transaction id, category id) matches with one write per category; returns the count"""
+        ids_by_category = defaultdict(list)
+        for transaction_id, category_id in matches:
+            if category_id:
+                ids_by_category[category_id].append(transaction_id)
+        
+        for category_id, transaction_ids in ids_by_category.items():
+            self.browse(transaction_ids).write({'category_id': category_id})
+        return sum(len(ids) for ids in ids_by_category.values())
+
     @api.model
     def action_bulk_sync_to_erpnext(self):
         """Bulk sync all categorized but unsynced transactions"""
@@ -134,29 +173,15 @@ class BankTransactionExtended(models.Model):
                 }
             }
         
-        success_count = 0
-        failed_count = 0
-        
-        for trans in transactions:
-            try:
-                config.create_journal_entry(trans)
-                success_count += 1
-            except Exception as e:
-                _logger.error(f"Failed to sync transaction {trans.id}: {str(e)}")
-                trans.erpnext_error = str(e)
-                failed_count += 1
-                continue
-        
-        message = f'Successfully synced {success_count} transactions.'
-        if failed_count > 0:
-            message += f' {failed_count} failed.'
+        # Pushed by the ERPNext sync queue cron, not within this request
+        self.env['erpnext.sync.job'].enqueue(transactions, config)
         
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
             'params': {
-                'title': 'Bulk Sync Complete',
-                'message': message,
-                'type': 'success' if failed_count == 0 else 'warning',
+                'title': 'Bulk Sync Queued',
+                'message': f'Queued {len(transactions)} transactions for syncing to ERPNext.',
+                'type': 'success',
             }
         }
@@ -0,0 +1,174 @@
+from odoo import models, fields, api
+from datetime import timedelta
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Jobs claimed and pushed together by one drain iteration
+JOB_BATCH_SIZE = 200
+# A job is given up (state failed) after this many attempts
+JOB_MAX_ATTEMPTS = 5
+# Minutes a claimed job stays reserved before another worker may take it over;
+# claims are sized so their pushes fit in the lease, see _claim_size
+JOB_LEASE_MINUTES = 60
+# Retry delay after the n-th failed attempt: RETRY_BASE_MINUTES * 2 ** (n - 1), at most RETRY_MAX_MINUTES
+RETRY_BASE_MINUTES = 5
+RETRY_MAX_MINUTES = 24 * 60
+# Seconds one cron run keeps draining before leaving the rest to the next run
+DRAIN_TIME_BUDGET = 240
+
+class ERPNextSyncJob(models.Model):
+    _name = 'erpnext.sync.job'
+    _description = 'ERPNext Sync Job'
+    _order = 'next_retry, id'
+
+    transaction_id = fields.Many2one('bank.transaction', string='Transaction', required=True,
+                                     ondelete='cascade', index=True)
+    config_id = fields.Many2one('erpnext.config', string='Configuration', required=True, ondelete='cascade')
+    idempotency_key = fields.Char(string='Idempotency Key', required=True, readonly=True,
+                                  help='Reference identifying the Journal Entry pushed for the transaction')
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ], string='State', default='pending', required=True, index=True)
+    attempts = fields.Integer(string='Attempts', default=0, readonly=True)
+    next_retry = fields.Datetime(string='Next Attempt', default=fields.Datetime.now, required=True, index=True,
+                                 help='When a pending job is due, or when the lease of a running job expires')
+    last_error = fields.Text(string='Last Error', readonly=True)
+
+    _sql_constraints = [
+        ('idempotency_key_unique', 'UNIQUE(idempotency_key)', 'A sync job already exists for this transaction!')
+    ]
+
+    @api.model
+    def enqueue(self, transactions, config):
+        """Queue the transactions for pushing to ERPNext and wake up the drain cron.
+
+        Transactions keep a single job, keyed on their journal entry
+        reference: queued jobs are left alone and finished ones are reset.
+        Returns the jobs of the transactions.
+        """
+        keys = {config._journal_entry_reference(transaction): transaction for transaction in transactions}
+        existing = self.search([('idempotency_key', 'in', list(keys))])
+        existing.filtered(lambda j: j.state in ('done', 'failed')).write({
+            'state': 'pending',
+            'attempts': 0,
+            'next_retry': fields.Datetime.now(),
+            'last_error': False,
+        })
+        
+        known = set(existing.mapped('idempotency_key'))
+        jobs = existing | self.create([{
+            'transaction_id': transaction.id,
+            'config_id': config.id,
+            'idempotency_key': key,
+        } for key, transaction in keys.items() if key not in known])
+        
+        cron = self.env.ref('gmail_erpnext_bridge.cron_process_erpnext_sync_jobs', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+        return jobs
+
+    def action_retry(self):
+        """Make the selected jobs due immediately"""
+        self.filtered(lambda j: j.state != 'running').write({
+            'state': 'pending',
+            'next_retry': fields.Datetime.now(),
+        })
+        cron = self.env.ref('gmail_erpnext_bridge.cron_process_erpnext_sync_jobs', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    @api.model
+    def _claim_size(self, limit=JOB_BATCH_SIZE):
+        """Cap limit so even the slowest configuration pushes a claimed batch within its lease.
+
+        Jobs are pushed sync_concurrency at a time and each push may take
+        up to _max_request_seconds(), retries included.
+        """
+        lease = JOB_LEASE_MINUTES * 60
+        for config in self.env['erpnext.config'].sudo().search([]):
+            rounds = max(int(lease // config._max_request_seconds()), 1)
+            limit = min(limit, rounds * max(config.sync_concurrency, 1))
+        return limit
+
+    @api.model
+    def _claim_jobs(self, limit=JOB_BATCH_SIZE):
+        """Reserve up to limit due jobs for this worker and return them.
+
+        FOR UPDATE SKIP LOCKED lets concurrent workers claim disjoint jobs
+        without waiting on each other. Claimed jobs are leased rather than
+        kept locked: if the worker dies, they are due again once
+        JOB_LEASE_MINUTES have passed. Callers size limit with _claim_size.
+        """
+        now = fields.Datetime.now()
+        self.flush_model()
+        self.env.cr.execute(f"""
+            UPDATE {self._table}
+               SET state = 'running', attempts = attempts + 1, next_retry = %s
+             WHERE id IN (
+                    SELECT id FROM {self._table}
+                     WHERE state IN ('pending', 'running') AND next_retry <= %s
+                     ORDER BY next_retry, id
+                     LIMIT %s
+                       FOR UPDATE SKIP LOCKED
+             )
+         RETURNING id
+        """, [now + timedelta(minutes=JOB_LEASE_MINUTES), now, limit])
+        job_ids = [row[0] for row in self.env.cr.fetchall()]
+        self.invalidate_model(['state', 'attempts', 'next_retry'])
+        return self.browse(job_ids)
+
+    @api.model
+    def _cron_process_jobs(self, limit=JOB_BATCH_SIZE):
+        """Drain due jobs batch by batch until none are left or the time budget is spent"""
+        limit = self._claim_size(limit)
+        started = time.monotonic()
+        processed = 0
+        while time.monotonic() - started < DRAIN_TIME_BUDGET:
+            jobs = self._claim_jobs(limit)
+            if not jobs:
+                break
+            if not self.env.registry.in_test_mode():
+                # Publish the lease before the (slow) pushes
+                self.env.cr.commit()
+            
+            jobs._process()
+            processed += len(jobs)
+            if not self.env.registry.in_test_mode():
+                self.env.cr.commit()
+        
+        if processed:
+            _logger.info(f"Processed {processed} ERPNext sync jobs")
+        return processed
+
+    def _process(self):
+        """Push the claimed jobs' transactions and record each job's outcome"""
+        errors = {}
+        for config in self.config_id:
+            jobs = self.filtered(lambda j: j.config_id == config)
+            transactions = jobs.transaction_id.filtered(lambda t: not t.erpnext_synced)
+            if not transactions:
+                continue
+            try:
+                # Any earlier push of these transactions (a previous attempt, or a
+                # job that was reset) may have reached ERPNext after all
+                config.sync_transactions(transactions, check_existing=True)
+            except Exception as e:
+                _logger.error(f"ERPNext sync of {len(transactions)} transactions failed: {str(e)}")
+                errors.update(dict.fromkeys(jobs.ids, str(e)))
+        
+        now = fields.Datetime.now()
+        done = self.filtered(lambda j: j.transaction_id.erpnext_synced)
+        done.write({'state': 'done', 'last_error': False})
+        for job in self - done:
+            vals = {'last_error': errors.get(job.id) or job.transaction_id.erpnext_error or 'Not synced'}
+            if job.attempts >= JOB_MAX_ATTEMPTS:
+                vals['state'] = 'failed'
+            else:
+                delay = min(RETRY_BASE_MINUTES * 2 ** (job.attempts - 1), RETRY_MAX_MINUTES)
+                vals.update(state='pending', next_retry=now + timedelta(minutes=delay))
+            job.write(vals)
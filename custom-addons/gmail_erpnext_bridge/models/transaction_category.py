@@ -1,4 +1,5 @@
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
+import re
 
 class TransactionCategory(models.Model):
     _name = 'transaction.category'
@@ -23,19 +24,61 @@ class TransactionCategory(models.Model):
     active = fields.Boolean(default=True)
     color = fields.Integer(string='Color Index')
 
+    def _get_keyword_matcher_key(self):
+        """Digest of what the matcher is built from: ids, names (the search order), keywords and active flags"""
+        self.flush_model(['name', 'keywords', 'active'])
+        self.env.cr.execute(f"""
+            SELECT md5(COALESCE(string_agg(
+                       id || ':' || md5(name) || ':' || md5(COALESCE(keywords, '')) || ':' || COALESCE(active, FALSE),
+                       ',' ORDER BY id), ''))
+              FROM {self._table}
+        """)
+        return self.env.cr.fetchone()[0]
+
+    def _get_keyword_matcher(self):
+        """Return (pattern, category ids), compiled once per state of the categories"""
+        return self._compile_keyword_matcher(self._get_keyword_matcher_key())
+
+    @tools.ormcache('key')
+    def _compile_keyword_matcher(self, key):
+        """Compile all active keywords into one regex.
+
+        The cache is keyed on the categories' content rather than cleared
+        on every edit, so category changes never flush other models'
+        caches; each worker recompiles on its next match after a change.
+        Each category is a lookahead tried in search order, so the first
+        category with a keyword anywhere in the description wins, as in a
+        category-by-category scan.
+        """
+        alternatives = []
+        category_ids = []
+        for category in self.sudo().search([('active', '=', True)]):
+            keywords = {k.strip().lower() for k in (category.keywords or '').split(',')}
+            keywords.discard('')
+            if keywords:
+                pattern = '|'.join(re.escape(k) for k in sorted(keywords))
+                alternatives.append(f'(?=.*?(?:{pattern}))(?P<c{len(category_ids)}>)')
+                category_ids.append(category.id)
+        
+        if not alternatives:
+            return None, []
+        return re.compile('|'.join(alternatives), re.DOTALL), category_ids
+
+    @api.model
+    def match_category_ids(self, descriptions):
+        """Return the matching category id (or False) for each description, in one pass"""
+        pattern, category_ids = self._get_keyword_matcher()
+        if pattern is None:
+            return [False] * len(descriptions)
+        
+        result = []
+        for description in descriptions:
+            match = pattern.match(description.lower()) if description else None
+            result.append(category_ids[int(match.lastgroup[1:])] if match else False)
+        return result
+
     @api.model
     def auto_categorize_transaction(self, description):
         """Find matching category based on keywords"""
-        if not description:
-            return False
-        
-        description_lower = description.lower()
-        categories = self.search([('active', '=', True)])
-        
-        for category in categories:
-            if category.keywords:
-                keywords = [k.strip().lower() for k in category.keywords.split(',')]
-                if any(keyword in description_lower for keyword in keywords):
-                    return category
-        
-        return False
+        category_id = self.match_category_ids([description])[0]
+        return self.browse(category_id) if category_id else False